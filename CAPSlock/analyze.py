@@ -2,24 +2,46 @@ from __future__ import annotations
 
 import itertools
 import json
-from dataclasses import asdict
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from operator import attrgetter
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
 
-from CAPSlock.models import PolicyResult, SignInContext
-from CAPSlock.query import get_policy_results_for_user
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
+from CAPSlock.conditions import build_policy_shape, referenced_signals
+from CAPSlock.db import get_session
+from CAPSlock.evaluator import evaluate_targeted_conditions
+from CAPSlock.models import PolicyResult, PolicyShape, SignInContext
+from CAPSlock.query import evaluate_policies, load_user_policies
 
-def _has_signal_dependent_note(reason: Optional[str]) -> bool:
-    if not reason:
-        return False
-    return "Signal-dependent:" in reason
 
+# Values permuted for each axis when it is not fixed.
+_PLATFORM_DEFAULT = ("windows", "macos", "linux", "ios", "android")
+_CLIENT_APP_DEFAULT = (None, "browser", "mobileAppsAndDesktopClients", "exchangeActiveSync", "other")
+_TRUSTED_LOCATION_DEFAULT = (None, True, False)
+_SIGNIN_RISK_DEFAULT = (None, "none", "low", "medium", "high")
+_USER_RISK_DEFAULT = (None, "low", "medium", "high")
+_AUTH_FLOW_DEFAULT = (None, "devicecodeflow", "authtransfer")
+_DEVICE_FILTER_DEFAULT = (None, True, False)
+_INACTIVE = (None,)
 
-def _controls_lower(r: PolicyResult) -> List[str]:
-    if not r.controls:
-        return []
-    return [str(x).lower() for x in r.controls if x is not None]
+# Scenario axes permuted by iter_scenarios, in a fixed order used for matrix keys.
+_AXES = ("trusted_location", "platform", "client_app", "signin_risk", "user_risk", "auth_flow", "device_filter")
+
+# One bit per axis, in _AXES order, so axis sets compare as integer masks.
+_AXIS_BITS = {a: 1 << i for i, a in enumerate(_AXES)}
+_ALL_AXES_MASK = (1 << len(_AXES)) - 1
+_axes_of = attrgetter(*_AXES)
+
+
+def _controls_lower(r: PolicyResult) -> FrozenSet[str]:
+    if r.controls_lower is None:
+        r.controls_lower = frozenset(str(x).lower() for x in (r.controls or []) if x is not None)
+    return r.controls_lower
 
 
 def _is_mfa(r: PolicyResult) -> bool:
@@ -27,37 +49,12 @@ def _is_mfa(r: PolicyResult) -> bool:
 
 
 def _is_block(r: PolicyResult) -> bool:
-    if (r.effect or "").lower() == "block":
+    # evaluate_policy_detail only ever sets the capitalised "Block" effect
+    if r.effect == "Block":
         return True
     return "block" in _controls_lower(r)
 
 
-def _definitive_enabled(results: List[PolicyResult]) -> List[PolicyResult]:
-    out: List[PolicyResult] = []
-    for r in results:
-        if not r.applies:
-            continue
-        if (r.state or "") != "Enabled":
-            continue
-        if _has_signal_dependent_note(r.applies_reason):
-            continue
-        out.append(r)
-    return out
-
-
-def _definitive_reporting(results: List[PolicyResult]) -> List[PolicyResult]:
-    out: List[PolicyResult] = []
-    for r in results:
-        if not r.applies:
-            continue
-        if (r.state or "") != "Reporting":
-            continue
-        if _has_signal_dependent_note(r.applies_reason):
-            continue
-        out.append(r)
-    return out
-
-
 def _summarize_policy(r: PolicyResult) -> Dict[str, Any]:
     return {
         "policy_id": r.policy.objectId,
@@ -70,18 +67,29 @@ def _summarize_policy(r: PolicyResult) -> Dict[str, Any]:
     }
 
 
+# id(PolicyResult) -> (result, summary), created per analyze() run. The result is
+# kept alongside its summary so the id cannot be recycled while the entry exists.
+_SummaryCache = Dict[int, Tuple[PolicyResult, Dict[str, Any]]]
+
+
+def _cached_summary(r: PolicyResult, summaries: _SummaryCache) -> Dict[str, Any]:
+    hit = summaries.get(id(r))
+    if hit is None:
+        hit = summaries[id(r)] = (r, _summarize_policy(r))
+    return hit[1]
+
+
 def _scenario_dict(ctx: SignInContext) -> Dict[str, Any]:
-    d = asdict(ctx)
     return {
-        "resource": d.get("app_id"),
-        "acr": d.get("acr"),
-        "trusted_location": d.get("trusted_location"),
-        "platform": d.get("platform"),
-        "client_app": d.get("client_app"),
-        "signin_risk": d.get("signin_risk"),
-        "user_risk": d.get("user_risk"),
-        "auth_flow": d.get("auth_flow"),
-        "device_filter": d.get("device_filter"),
+        "resource": ctx.app_id,
+        "acr": ctx.acr,
+        "trusted_location": ctx.trusted_location,
+        "platform": ctx.platform,
+        "client_app": ctx.client_app,
+        "signin_risk": ctx.signin_risk,
+        "user_risk": ctx.user_risk,
+        "auth_flow": ctx.auth_flow,
+        "device_filter": ctx.device_filter,
     }
 
 
@@ -91,96 +99,314 @@ def _gap_record(
     summary: str,
     definitive: List[PolicyResult],
     signal_dependent: List[PolicyResult],
+    summaries: _SummaryCache,
 ) -> Dict[str, Any]:
     return {
         "gap_type": gap_type,
         "scenario": scenario,
         "summary": summary,
         "policies": {
-            "definitive": [_summarize_policy(r) for r in definitive],
-            "signal_dependent": [_summarize_policy(r) for r in signal_dependent],
+            "definitive": [_cached_summary(r, summaries) for r in definitive],
+            "signal_dependent": [_cached_summary(r, summaries) for r in signal_dependent],
         },
     }
 
 
-def _classify_gaps(results: List[PolicyResult], ctx: SignInContext) -> List[Dict[str, Any]]:
-    sig = [r for r in results if r.applies and _has_signal_dependent_note(r.applies_reason)]
-    def_en = _definitive_enabled(results)
-    def_rep = _definitive_reporting(results)
-
-    scenario = _scenario_dict(ctx)
-    gaps: List[Dict[str, Any]] = []
+def _split_applied(results: List[PolicyResult]) -> Tuple[List[PolicyResult], List[PolicyResult], List[PolicyResult]]:
+    # Single pass: split applied results into definitive Enabled, definitive
+    # Reporting and signal-dependent buckets.
+    def_en: List[PolicyResult] = []
+    def_rep: List[PolicyResult] = []
+    sig: List[PolicyResult] = []
+    for r in results:
+        if r.signal_dependent:
+            sig.append(r)
+            continue
+        state = r.state or ""
+        if state == "Enabled":
+            def_en.append(r)
+        elif state == "Reporting":
+            def_rep.append(r)
+    return def_en, def_rep, sig
+
+
+# Gap codes returned by _classify_counts.
+_GAP_NONE = 0
+_GAP_NO_POLICIES = 1
+_GAP_REPORT_ONLY = 2
+_GAP_TRUSTED_NO_POLICIES = 3
+_GAP_TRUSTED_REPORT_ONLY = 4
+_GAP_TRUSTED_NOT_ENFORCED = 5
+
+# gap code -> (gap_type, summary, whether the record lists the Enabled policies
+# rather than the Reporting ones, or None when no definitive policies apply)
+_GAP_TEMPLATES: Dict[int, Tuple[str, str, Optional[bool]]] = {
+    _GAP_NO_POLICIES: (
+        "NO_POLICIES_APPLY",
+        "No definitive policies apply in this scenario.",
+        None,
+    ),
+    _GAP_REPORT_ONLY: (
+        "REPORT_ONLY_BYPASS",
+        "Only report-only (Reporting) definitive policies apply; no enforcement.",
+        False,
+    ),
+    _GAP_TRUSTED_NO_POLICIES: (
+        "TRUSTED_LOCATION_BYPASS",
+        "No definitive policies apply when signing in from a trusted location.",
+        None,
+    ),
+    _GAP_TRUSTED_REPORT_ONLY: (
+        "TRUSTED_LOCATION_BYPASS",
+        "Only report-only (Reporting) policies apply from trusted location; no enforcement.",
+        False,
+    ),
+    _GAP_TRUSTED_NOT_ENFORCED: (
+        "TRUSTED_LOCATION_BYPASS",
+        "Trusted location has definitive policies, but none enforce MFA or Block.",
+        True,
+    ),
+}
+
+
+def _classify_counts(n_en: int, n_rep: int, n_enforcing: int, trusted: bool) -> int:
+    """
+    Map the definitive policy counts of a scenario to a gap code. n_enforcing is the
+    number of definitive Enabled policies that block or require MFA.
+    """
+    if trusted:
+        if not n_en:
+            return _GAP_TRUSTED_REPORT_ONLY if n_rep else _GAP_TRUSTED_NO_POLICIES
+        return _GAP_NONE if n_enforcing else _GAP_TRUSTED_NOT_ENFORCED
+
+    if n_en:
+        return _GAP_NONE
+    return _GAP_REPORT_ONLY if n_rep else _GAP_NO_POLICIES
+
+
+def _gap_for_code(
+    code: int, results: List[PolicyResult], ctx: SignInContext, summaries: _SummaryCache
+) -> List[Dict[str, Any]]:
+    if code == _GAP_NONE:
+        return []
 
-    if ctx.trusted_location is True:
-        if not def_en and not def_rep:
-            gaps.append(
-                _gap_record(
-                    "TRUSTED_LOCATION_BYPASS",
-                    scenario,
-                    "No definitive policies apply when signing in from a trusted location.",
-                    definitive=[],
-                    signal_dependent=sig,
-                )
-            )
-            return gaps
-
-        if not def_en and def_rep:
-            gaps.append(
-                _gap_record(
-                    "TRUSTED_LOCATION_BYPASS",
-                    scenario,
-                    "Only report-only (Reporting) policies apply from trusted location; no enforcement.",
-                    definitive=def_rep,
-                    signal_dependent=sig,
-                )
-            )
-            return gaps
-
-        if def_en:
-            has_block = any(_is_block(r) for r in def_en)
-            has_mfa = any(_is_mfa(r) for r in def_en)
-            if not has_block and not has_mfa:
-                gaps.append(
-                    _gap_record(
-                        "TRUSTED_LOCATION_BYPASS",
-                        scenario,
-                        "Trusted location has definitive policies, but none enforce MFA or Block.",
-                        definitive=def_en,
-                        signal_dependent=sig,
-                    )
-                )
-
-    if not def_en and not def_rep:
-        gaps.append(
-            _gap_record(
-                "NO_POLICIES_APPLY",
-                scenario,
-                "No definitive policies apply in this scenario.",
-                definitive=[],
-                signal_dependent=sig,
-            )
+    gap_type, summary, use_enabled = _GAP_TEMPLATES[code]
+    def_en, def_rep, sig = _split_applied(results)
+    if use_enabled is None:
+        definitive: List[PolicyResult] = []
+    elif use_enabled:
+        definitive = def_en
+    else:
+        definitive = def_rep
+
+    return [
+        _gap_record(
+            gap_type,
+            _scenario_dict(ctx),
+            summary,
+            definitive=definitive,
+            signal_dependent=sig,
+            summaries=summaries,
         )
-        return gaps
-
-    if not def_en and def_rep:
-        gaps.append(
-            _gap_record(
-                "REPORT_ONLY_BYPASS",
-                scenario,
-                "Only report-only (Reporting) definitive policies apply; no enforcement.",
-                definitive=def_rep,
-                signal_dependent=sig,
-            )
-        )
-        return gaps
+    ]
 
-    return gaps
 
+# Both classifiers receive only the policies that apply in the scenario and decide
+# from counts first, so the buckets and the scenario dict are only built once a
+# gap is actually possible.
 
-def _values_or_default(v: Optional[Any], default_values: List[Any]) -> List[Any]:
-    if v is None:
-        return default_values
-    return [v]
+def _classify_gaps_untrusted(
+    results: List[PolicyResult], ctx: SignInContext, summaries: _SummaryCache
+) -> List[Dict[str, Any]]:
+    # Any definitive Enabled policy means enforcement, which is the common case.
+    n_rep = 0
+    for r in results:
+        if r.signal_dependent:
+            continue
+        if r.state == "Enabled":
+            return []
+        if r.state == "Reporting":
+            n_rep += 1
+
+    return _gap_for_code(_classify_counts(0, n_rep, 0, False), results, ctx, summaries)
+
+
+def _classify_gaps_trusted(
+    results: List[PolicyResult], ctx: SignInContext, summaries: _SummaryCache
+) -> List[Dict[str, Any]]:
+    n_en = 0
+    n_rep = 0
+    n_enforcing = 0
+    for r in results:
+        if r.signal_dependent:
+            continue
+        if r.state == "Enabled":
+            n_en += 1
+            if _is_block(r) or _is_mfa(r):
+                n_enforcing += 1
+        elif r.state == "Reporting":
+            n_rep += 1
+
+    return _gap_for_code(_classify_counts(n_en, n_rep, n_enforcing, True), results, ctx, summaries)
+
+
+def _classify_gaps(
+    results: List[PolicyResult], ctx: SignInContext, summaries: _SummaryCache
+) -> List[Dict[str, Any]]:
+    if ctx.trusted_location is True:
+        return _classify_gaps_trusted(results, ctx, summaries)
+    return _classify_gaps_untrusted(results, ctx, summaries)
+
+
+def _make_classifier(
+    trusted_location: Optional[bool],
+) -> Callable[[List[PolicyResult], SignInContext, _SummaryCache], List[Dict[str, Any]]]:
+    """
+    Return the gap classifier for one analyze run. When trusted_location is held
+    fixed, every scenario takes the same trusted/untrusted path, so it is picked
+    once here instead of being read from each scenario.
+    """
+    if trusted_location is None:
+        return _classify_gaps
+    if trusted_location is True:
+        return _classify_gaps_trusted
+    return _classify_gaps_untrusted
+
+
+def _gap_key(g: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (
+        g["gap_type"],
+        g["summary"],
+        tuple(sorted(p["policy_id"] for p in g["policies"]["definitive"])),
+        tuple(sorted(p["policy_id"] for p in g["policies"]["signal_dependent"])),
+    )
+
+
+def _values_or_default(v: Optional[Any], default_values: Tuple[Any, ...]) -> Tuple[Any, ...]:
+    return default_values if v is None else (v,)
+
+
+@dataclass(eq=False)
+class _MatrixRow:
+    policy: Any
+    detail: Dict[str, Any]
+    shape: PolicyShape
+    state: Optional[str]
+    targeting_reason: str
+    axes: Tuple[str, ...] = ()
+    axis_mask: int = 0
+    # Reads the row's axis values from a scenario; the result keys row.results.
+    key_of: Callable[[SignInContext], Any] = lambda ctx: ()
+    results: Dict[Any, PolicyResult] = field(default_factory=dict)
+
+
+@dataclass(eq=False)
+class _ConditionMatrix:
+    rows: List[_MatrixRow]
+    location_trust_map: Dict[str, bool]
+
+
+def _build_condition_matrix(session, user_upn: str) -> _ConditionMatrix:
+    """
+    Load the user's policies once and record, per policy, which scenario axes its
+    conditions read. State and user targeting do not depend on the sign-in, so they
+    are resolved here; policies that are disabled or do not target the user can
+    never apply and get no row.
+    """
+    loaded = load_user_policies(session, user_upn)
+    if loaded is None:
+        return _ConditionMatrix(rows=[], location_trust_map={})
+
+    results = evaluate_policies(loaded, mode="get-policies")
+
+    rows: List[_MatrixRow] = []
+    # evaluate_policies returns one result per loaded detail, in the same order.
+    for (_, _, shape), r in zip(loaded.details, results):
+        if not r.applies:
+            continue
+        if shape is None:
+            shape = build_policy_shape(r.detail)
+        signals = referenced_signals(shape)
+        row = _MatrixRow(
+            policy=r.policy,
+            detail=r.detail,
+            shape=shape,
+            state=r.state,
+            targeting_reason=r.applies_reason,
+            axes=tuple(a for a in _AXES if a in signals),
+        )
+        row.axis_mask = sum(_AXIS_BITS[a] for a in row.axes)
+        if row.axes:
+            row.key_of = attrgetter(*row.axes)
+        rows.append(row)
+
+    return _ConditionMatrix(rows=rows, location_trust_map=loaded.location_trust_map)
+
+
+def _relevant_axes(matrix: _ConditionMatrix) -> Set[str]:
+    """
+    Return the scenario axes referenced by at least one policy targeting the user.
+    Axes no policy inspects cannot change any evaluation, so permuting them only
+    multiplies the scenario count.
+    """
+    axes: Set[str] = set()
+    for row in matrix.rows:
+        axes.update(row.axes)
+
+    # _classify_gaps reports trusted-location bypasses from the scenario itself,
+    # so that axis is always permuted even when no policy uses locations.
+    axes.add("trusted_location")
+    return axes
+
+
+def _row_result(matrix: _ConditionMatrix, row: _MatrixRow, ctx: SignInContext) -> PolicyResult:
+    # Scenarios that agree on every axis this policy reads share one result.
+    key = row.key_of(ctx)
+    r = row.results.get(key)
+    if r is None:
+        r = evaluate_targeted_conditions(
+            policy=row.policy,
+            detail=row.detail,
+            state=row.state,
+            targeting_reason=row.targeting_reason,
+            signin_ctx=ctx,
+            location_trust_map=matrix.location_trust_map,
+            # Gap records only describe applied policies, so blocker text is unused.
+            fast_fail=True,
+            shape=row.shape,
+        )
+        row.results[key] = r
+    return r
+
+
+def _evaluate_scenarios(
+    matrix: _ConditionMatrix, contexts: Iterable[SignInContext]
+) -> Iterator[Tuple[SignInContext, List[PolicyResult]]]:
+    """
+    Evaluate scenarios in order. Neighbouring scenarios usually differ in only one
+    or two axes, so each policy keeps its previous result unless one of the axes it
+    reads changed since the last scenario. Only applied results are yielded for
+    each scenario.
+    """
+    current: List[Optional[PolicyResult]] = [None] * len(matrix.rows)
+    prev_vals: Optional[Tuple[Any, ...]] = None
+
+    for ctx in contexts:
+        vals = _axes_of(ctx)
+        if prev_vals is None:
+            changed = _ALL_AXES_MASK
+        else:
+            changed = 0
+            for i, (v, pv) in enumerate(zip(vals, prev_vals)):
+                if v != pv:
+                    changed |= 1 << i
+
+        for i, row in enumerate(matrix.rows):
+            if current[i] is None or changed & row.axis_mask:
+                current[i] = _row_result(matrix, row, ctx)
+
+        yield ctx, [r for r in current if r.applies]
+        prev_vals = vals
 
 
 def iter_scenarios(
@@ -192,21 +418,34 @@ def iter_scenarios(
     user_risk: Optional[str] = None,
     auth_flow: Optional[str] = None,
     device_filter: Optional[bool] = None,
+    active_axes: Optional[Set[str]] = None,
 ) -> Iterable[SignInContext]:
-    platform_vals = _values_or_default(platforms, ["windows", "macos", "linux", "ios", "android"])
-    client_vals = _values_or_default(client_app, [None, "browser", "mobileAppsAndDesktopClients", "exchangeActiveSync", "other"])
-    trusted_vals = _values_or_default(trusted_location, [None, True, False])
-    signin_vals = _values_or_default(signin_risk, [None, "none", "low", "medium", "high"])
-    user_vals = _values_or_default(user_risk, [None, "low", "medium", "high"])
-    auth_vals = _values_or_default(auth_flow, [None, "devicecodeflow", "authtransfer"])
-    device_filter_vals = _values_or_default(device_filter, [None, True, False])
+    def defaults(axis: str, values: Tuple[Any, ...]) -> Tuple[Any, ...]:
+        if active_axes is None or axis in active_axes:
+            return values
+        return _INACTIVE
+
+    platform_vals = _values_or_default(platforms, defaults("platform", _PLATFORM_DEFAULT))
+    client_vals = _values_or_default(client_app, defaults("client_app", _CLIENT_APP_DEFAULT))
+    trusted_vals = _values_or_default(trusted_location, defaults("trusted_location", _TRUSTED_LOCATION_DEFAULT))
+    signin_vals = _values_or_default(signin_risk, defaults("signin_risk", _SIGNIN_RISK_DEFAULT))
+    user_vals = _values_or_default(user_risk, defaults("user_risk", _USER_RISK_DEFAULT))
+    auth_vals = _values_or_default(auth_flow, defaults("auth_flow", _AUTH_FLOW_DEFAULT))
+    device_filter_vals = _values_or_default(device_filter, defaults("device_filter", _DEVICE_FILTER_DEFAULT))
+
+    # Fields that stay the same for every scenario are read from base once.
+    base_kwargs = {
+        "app_id": base.app_id,
+        "acr": base.acr,
+        "device_hybrid_joined": base.device_hybrid_joined,
+        "device_compliant": base.device_compliant,
+    }
 
     for p, c, t, sr, ur, af, df in itertools.product(
         platform_vals, client_vals, trusted_vals, signin_vals, user_vals, auth_vals, device_filter_vals
     ):
         yield SignInContext(
-            app_id=base.app_id,
-            acr=base.acr,
+            **base_kwargs,
             trusted_location=t,
             platform=p,
             client_app=c,
@@ -214,8 +453,6 @@ def iter_scenarios(
             user_risk=ur,
             auth_flow=af,
             device_filter=df,
-            device_hybrid_joined=base.device_hybrid_joined,
-            device_compliant=base.device_compliant,
         )
 
 
@@ -226,36 +463,54 @@ def analyze(
     fixed: Dict[str, Any],
     max_scenarios: int = 1000,
 ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
-    gaps_out: List[Dict[str, Any]] = []
+    # Policy summaries shared by this run's gap records; local so concurrent runs
+    # in one process never see each other's entries.
+    summaries: _SummaryCache = {}
+
+    # Scenarios that differ only in axes that did not change the outcome produce the
+    # same gap; keep one record per distinct gap and roll the scenarios up into it.
+    gap_buckets: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
     gap_counts = {
         "NO_POLICIES_APPLY": 0,
         "REPORT_ONLY_BYPASS": 0,
         "TRUSTED_LOCATION_BYPASS": 0,
     }
 
+    matrix = _build_condition_matrix(session, user_upn)
+    classify = _make_classifier(fixed.get("trusted_location"))
+    scenarios = itertools.islice(
+        iter_scenarios(
+            base=base,
+            platforms=fixed.get("platform"),
+            client_app=fixed.get("client_app"),
+            trusted_location=fixed.get("trusted_location"),
+            signin_risk=fixed.get("signin_risk"),
+            user_risk=fixed.get("user_risk"),
+            auth_flow=fixed.get("auth_flow"),
+            device_filter=fixed.get("device_filter"),
+            active_axes=_relevant_axes(matrix),
+        ),
+        # The first scenario is always evaluated, even for a max of 0 or below
+        max(1, max_scenarios),
+    )
     scenarios_evaluated = 0
 
-    for ctx in iter_scenarios(
-        base=base,
-        platforms=fixed.get("platform"),
-        client_app=fixed.get("client_app"),
-        trusted_location=fixed.get("trusted_location"),
-        signin_risk=fixed.get("signin_risk"),
-        user_risk=fixed.get("user_risk"),
-        auth_flow=fixed.get("auth_flow"),
-        device_filter=fixed.get("device_filter"),
-    ):
+    # Scenarios are generated lazily and evaluated in order, so only the current
+    # one is alive at a time and gaps keep the scenario order.
+    for ctx, results in _evaluate_scenarios(matrix, scenarios):
         scenarios_evaluated += 1
-        results = get_policy_results_for_user(session, user_upn=user_upn, signin_ctx=ctx, mode="what-if")
-        gaps = _classify_gaps(results, ctx)
-        for g in gaps:
+        for g in classify(results, ctx, summaries):
             gt = g["gap_type"]
             if gt in gap_counts:
                 gap_counts[gt] += 1
-            gaps_out.append(g)
 
-        if scenarios_evaluated >= max_scenarios:
-            break
+            key = _gap_key(g)
+            record = gap_buckets.get(key)
+            if record is None:
+                g["scenarios"] = [g["scenario"]]
+                gap_buckets[key] = g
+            else:
+                record["scenarios"].append(g["scenario"])
 
     summary = {
         "generated_at": datetime.now(timezone.utc).isoformat(),
@@ -265,15 +520,58 @@ def analyze(
         "scenarios_evaluated": scenarios_evaluated,
         "max_scenarios": max_scenarios,
         "gap_counts": gap_counts,
+        "distinct_gaps": len(gap_buckets),
     }
 
-    return summary, gaps_out
+    return summary, list(gap_buckets.values())
+
+
+_WRITE_CHUNK = 1 << 20
+
+
+def analyze_db(
+    db_path: str,
+    user_upn: str,
+    base: SignInContext,
+    fixed: Dict[str, Any],
+    max_scenarios: int = 1000,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    # Picklable entry point for running analyze in another process: it opens its
+    # own session rather than receiving one.
+    session = get_session(db_path)
+    try:
+        return analyze(
+            session=session,
+            user_upn=user_upn,
+            base=base,
+            fixed=fixed,
+            max_scenarios=max_scenarios,
+        )
+    finally:
+        session.close()
 
 
 def write_outputs(summary: Dict[str, Any], gaps: List[Dict[str, Any]], prefix: str) -> Tuple[str, str]:
     summary_path = f"{prefix}.summary.json"
     gaps_path = f"{prefix}.gaps.jsonl"
 
+    if orjson is not None:
+        with open(summary_path, "wb") as f:
+            f.write(orjson.dumps(summary, option=orjson.OPT_INDENT_2))
+
+        # Collect records in memory and hand them to the file in ~1 MiB writes.
+        with open(gaps_path, "wb") as f:
+            buf = bytearray()
+            for g in gaps:
+                buf += orjson.dumps(g, option=orjson.OPT_APPEND_NEWLINE)
+                if len(buf) >= _WRITE_CHUNK:
+                    f.write(buf)
+                    buf.clear()
+            if buf:
+                f.write(buf)
+
+        return summary_path, gaps_path
+
     with open(summary_path, "w", encoding="utf-8") as f:
         json.dump(summary, f, indent=2, sort_keys=False)
 
@@ -2,7 +2,7 @@ from __future__ import annotations
 import argparse
 import os
 import sys
-from CAPSlock.db import DB_PATH, get_session
+from CAPSlock.db import DB_PATH, create_indexes, get_session
 from CAPSlock.models import SignInContext
 from CAPSlock.normalize import normalize_bool_str, normalize_unknown_str
 from CAPSlock.query import get_policy_results_for_user, convert_from_id, convert_from_name
@@ -154,6 +154,19 @@ def cmd_list_locations(args) -> int:
     finally:
         session.close()
 
+def cmd_index_db(args) -> int:
+    try:
+        names = create_indexes(args.db)
+    except FileNotFoundError as e:
+        print(f"[!] {e}")
+        return 1
+
+    print(f"Indexes present in {args.db}:")
+    for name in names:
+        print(f"  {name}")
+    return 0
+
+
 def cmd_analyze(args) -> int:
     session = get_session(args.db)
     try:
@@ -203,6 +216,7 @@ def cmd_analyze(args) -> int:
         print("Gap counts:")
         for k, v in summary["gap_counts"].items():
             print(f"  {k}: {v}")
+        print(f"Distinct gaps: {summary['distinct_gaps']}")
         print()
         print(f"Summary: {summary_path}")
         print(f"Gaps:    {gaps_path}")
@@ -298,6 +312,11 @@ def build_parser() -> argparse.ArgumentParser:
     p3b.add_argument("--db", default=DB_PATH, help="Path to roadrecon.db (default: roadrecon.db)")
     p3b.set_defaults(func=cmd_list_locations)
 
+    # Index-db parser
+    p3c = sub.add_parser("index-db", help="Add lookup indexes to roadrecon.db (modifies the DB file)")
+    p3c.add_argument("--db", default=DB_PATH, help="Path to roadrecon.db (default: roadrecon.db)")
+    p3c.set_defaults(func=cmd_index_db)
+
     #Analyze parser
     p4 = sub.add_parser("analyze", help="Permute sign-in scenarios and report Conditional Access gaps")
     _add_common_user_args(p4)
@@ -1,9 +1,10 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Set, Tuple
-from CAPSlock.models import SignInContext, ConditionEval
+import itertools
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from CAPSlock.models import SignInContext, ConditionEval, PolicyShape, intern_str
 
-def _get_apps_from_condition(detail: Dict[str, Any]) -> Tuple[Set[str], Set[str]]:
-    apps_cond = (detail.get("Conditions", {}) or {}).get("Applications", {}) or {}
+def _get_apps_from_condition(cond: Dict[str, Any]) -> Tuple[Set[str], Set[str]]:
+    apps_cond = cond.get("Applications") or {}
     include_blocks = apps_cond.get("Include") or []
     exclude_blocks = apps_cond.get("Exclude") or []
 
@@ -19,9 +20,8 @@ def _get_apps_from_condition(detail: Dict[str, Any]) -> Tuple[Set[str], Set[str]
     return inc_apps, exc_apps
 
 
-def _get_acrs_from_condition(detail: Dict[str, Any]) -> Set[str]:
-    cond = (detail.get("Conditions", {}) or {})
-    apps = cond.get("Applications", {}) or {}
+def _get_acrs_from_condition(cond: Dict[str, Any]) -> Set[str]:
+    apps = cond.get("Applications") or {}
     include_blocks = apps.get("Include") or []
 
     policy_acrs: Set[str] = set()
@@ -33,61 +33,90 @@ def _get_acrs_from_condition(detail: Dict[str, Any]) -> Set[str]:
     return policy_acrs
 
 
-def _policy_target_mode(detail: Dict[str, Any]) -> str:
-    acrs = _get_acrs_from_condition(detail)
-    if acrs:
-        return "user_action"
-    return "cloud_app"
+# Scenario-independent outcomes of the resource condition, shared between calls
+_APP_UA_RESOURCE = ConditionEval(matched=False, reason="Resource: scenario resource provided but policy targets User actions")
+_APP_UA = ConditionEval(matched=True, reason="Resource: policy targets User actions (resource not applicable)")
+_APP_NONE = ConditionEval(matched=False, reason="Resource: policy target resources set to None (does not apply)")
+_APP_NO_COND = ConditionEval(matched=True, reason="Resource: no resource condition present")
+_APP_NO_COND_RT = ConditionEval(matched=True, reason="Resource: no resource condition present (scenario resource not provided)", runtime_dependent=True)
+_APP_NOT_PROVIDED = ConditionEval(matched=True, reason="Resource: scenario resource not provided", runtime_dependent=True)
+_APP_EXC_ALL = ConditionEval(matched=False, reason="Resource: excluded All")
+_APP_INC_ALL = ConditionEval(matched=True, reason="Resource: included All")
+_APP_NO_INCLUDE = ConditionEval(matched=True, reason="Resource: no include list (treat as match)")
 
 
-def _eval_app_condition(detail: Dict[str, Any], signin_ctx: SignInContext, mode: str) -> ConditionEval:
+def _app_user_action(shape: PolicyShape, resource: Optional[str]) -> ConditionEval:
     # If policy targets user actions, cloud-app resource scoping is not applicable.
     # If scenario incorrectly provided a resource for a user_action policy, treat as non-match.
-    if mode == "user_action":
-        if signin_ctx.app_id is not None:
-            return ConditionEval(
-                matched=False,
-                reason="Resource: scenario resource provided but policy targets User actions"
-            )
-        return ConditionEval(matched=True, reason="Resource: policy targets User actions (resource not applicable)")
+    return _APP_UA if resource is None else _APP_UA_RESOURCE
 
-    inc_apps, exc_apps = _get_apps_from_condition(detail)
-
-    # Policy targets "None" resources => does NOT apply 
-    if "None" in inc_apps:
-        return ConditionEval(matched=False, reason="Resource: policy target resources set to None (does not apply)")
 
+def _app_no_condition(shape: PolicyShape, resource: Optional[str]) -> ConditionEval:
     # No resource scoping present. Treat as match, but if scenario resource is missing, it can be runtime-dependent.
-    if not inc_apps and not exc_apps:
-        if signin_ctx.app_id is None:
-            return ConditionEval(matched=True, reason="Resource: no resource condition present (scenario resource not provided)", runtime_dependent=True)
-        return ConditionEval(matched=True, reason="Resource: no resource condition present")
+    return _APP_NO_COND_RT if resource is None else _APP_NO_COND
 
-    # If scenario resource is not provided, the outcome depends on what resource is being accessed
-    if signin_ctx.app_id is None:
-        return ConditionEval(matched=True, reason="Resource: scenario resource not provided", runtime_dependent=True)
 
-    resource = signin_ctx.app_id
+def _app_not_provided(shape: PolicyShape, resource: Optional[str]) -> ConditionEval:
+    # Policy targets "None" resources => does NOT apply
+    if "None" in shape.inc_apps:
+        return _APP_NONE
+    # Otherwise the outcome depends on what resource is being accessed
+    return _APP_NOT_PROVIDED
+
+
+def _app_include(shape: PolicyShape, resource: Optional[str]) -> ConditionEval:
+    inc_apps, exc_apps = shape.inc_apps, shape.exc_apps
+    if "None" in inc_apps:
+        return _APP_NONE
+    if resource in exc_apps:
+        return ConditionEval(matched=False, reason="Resource: excluded resource matched ({})", reason_arg=resource)
+    if "All" in exc_apps:
+        return _APP_EXC_ALL
+    if "All" in inc_apps:
+        return _APP_INC_ALL
+    if resource in inc_apps:
+        return ConditionEval(matched=True, reason="Resource: included resource matched ({})", reason_arg=resource)
+    return ConditionEval(matched=False, reason="Resource: resource did not match include list ({})", reason_arg=resource)
+
 
+def _app_exclude_only(shape: PolicyShape, resource: Optional[str]) -> ConditionEval:
+    exc_apps = shape.exc_apps
     if resource in exc_apps:
-        return ConditionEval(matched=False, reason=f"Resource: excluded resource matched ({resource})")
+        return ConditionEval(matched=False, reason="Resource: excluded resource matched ({})", reason_arg=resource)
     if "All" in exc_apps:
-        return ConditionEval(matched=False, reason="Resource: excluded All")
+        return _APP_EXC_ALL
+    return _APP_NO_INCLUDE
+
+
+def _app_handler(user_action: bool, no_resource: bool, has_inc: bool, has_exc: bool):
+    if user_action:
+        return _app_user_action
+    if not has_inc and not has_exc:
+        return _app_no_condition
+    if no_resource:
+        return _app_not_provided
+    return _app_include if has_inc else _app_exclude_only
+
 
-    if inc_apps:
-        if "All" in inc_apps:
-            return ConditionEval(matched=True, reason="Resource: included All")
-        if resource in inc_apps:
-            return ConditionEval(matched=True, reason=f"Resource: included resource matched ({resource})")
-        return ConditionEval(matched=False, reason=f"Resource: resource did not match include list ({resource})")
+# (mode == "user_action", app_id is None, has include list, has exclude list) -> handler
+_APP_HANDLERS = {
+    key: _app_handler(*key)
+    for key in itertools.product((False, True), repeat=4)
+}
 
-    return ConditionEval(matched=True, reason="Resource: no include list (treat as match)")
 
-def _eval_acr_condition(detail: Dict[str, Any], signin_ctx: SignInContext, mode: str) -> ConditionEval:
-    policy_acrs = _get_acrs_from_condition(detail)
+def _eval_app_condition(shape: PolicyShape, signin_ctx: SignInContext) -> ConditionEval:
+    resource = signin_ctx.app_id
+    handler = _APP_HANDLERS[
+        (shape.mode == "user_action", resource is None, bool(shape.inc_apps), bool(shape.exc_apps))
+    ]
+    return handler(shape, resource)
+
+def _eval_acr_condition(shape: PolicyShape, signin_ctx: SignInContext) -> ConditionEval:
+    policy_acrs = shape.policy_acrs
 
     # Cloud app policy: if scenario is an ACR test, this policy should not apply
-    if mode != "user_action":
+    if shape.mode != "user_action":
         if signin_ctx.acr is not None:
             return ConditionEval(matched=False, reason="ACR: scenario acr provided but policy targets Cloud apps")
         return ConditionEval(matched=True, reason="ACR: policy targets Cloud apps (ACR not applicable)")
@@ -103,28 +132,19 @@ def _eval_acr_condition(detail: Dict[str, Any], signin_ctx: SignInContext, mode:
         return ConditionEval(matched=True, reason="ACR: scenario acr not provided", runtime_dependent=True)
 
     if signin_ctx.acr in policy_acrs:
-        return ConditionEval(matched=True, reason=f"ACR: matched ({signin_ctx.acr})")
+        return ConditionEval(matched=True, reason="ACR: matched ({})", reason_arg=signin_ctx.acr)
 
-    return ConditionEval(matched=False, reason=f"ACR: scenario acr did not match policy ({signin_ctx.acr})")
+    return ConditionEval(matched=False, reason="ACR: scenario acr did not match policy ({})", reason_arg=signin_ctx.acr)
 
-def _eval_trusted_location_condition(detail: Dict[str, Any], signin_ctx: SignInContext, location_trust_map: Dict[str, bool] = None) -> ConditionEval:
-    locs = ((detail.get("Conditions", {}) or {}).get("Locations", {}) or {})
-    if not locs:
+def _eval_trusted_location_condition(shape: PolicyShape, signin_ctx: SignInContext, location_trust_map: Dict[str, bool] = None) -> ConditionEval:
+    if not shape.has_locations:
         return ConditionEval(matched=True, reason="Locations: no location condition present")
 
     if signin_ctx.trusted_location is None:
         return ConditionEval(matched=True, reason="Locations: scenario trusted_location not provided", runtime_dependent=True)
 
-    include_blocks = locs.get("Include") or []
-    exclude_blocks = locs.get("Exclude") or []
-
-    inc_locs: Set[str] = set()
-    exc_locs: Set[str] = set()
-
-    for blk in include_blocks:
-        inc_locs.update(blk.get("Locations", []) or [])
-    for blk in exclude_blocks:
-        exc_locs.update(blk.get("Locations", []) or [])
+    inc_locs = shape.inc_locs
+    exc_locs = shape.exc_locs
 
     # If we don't have the location trust map, fall back to runtime-dependent
     if location_trust_map is None and (inc_locs or exc_locs):
@@ -149,16 +169,16 @@ def _eval_trusted_location_condition(detail: Dict[str, Any], signin_ctx: SignInC
                 return ConditionEval(matched=False, reason="Locations: user in trusted location, policy excludes AllTrusted")
 
             # Check if any specific excluded locations are trusted
-            for loc_id in exc_locs:
-                if loc_id in location_trust_map and location_trust_map[loc_id]:
-                    return ConditionEval(matched=False, reason="Locations: user in trusted location, policy excludes this trusted location")
+            if any(location_trust_map.get(loc_id) for loc_id in exc_locs):
+                return ConditionEval(matched=False, reason="Locations: user in trusted location, policy excludes this trusted location")
         else:
             # User is NOT in trusted location - check if any excluded locations are untrusted
-            for loc_id in exc_locs:
-                if loc_id == "AllTrusted":
-                    continue  # User not in trusted location, so AllTrusted exclusion doesn't apply
-                if loc_id in location_trust_map and not location_trust_map[loc_id]:
-                    return ConditionEval(matched=False, reason="Locations: user not in trusted location, policy excludes this non-trusted location")
+            # (an AllTrusted exclusion doesn't apply)
+            if any(
+                loc_id != "AllTrusted" and loc_id in location_trust_map and not location_trust_map[loc_id]
+                for loc_id in exc_locs
+            ):
+                return ConditionEval(matched=False, reason="Locations: user not in trusted location, policy excludes this non-trusted location")
 
     # SECOND: Check inclusions - if user matches an inclusion, policy applies
     if not inc_locs:
@@ -169,21 +189,16 @@ def _eval_trusted_location_condition(detail: Dict[str, Any], signin_ctx: SignInC
         # Includes all locations (and we already checked exclusions above)
         return ConditionEval(matched=True, reason="Locations: policy includes All locations")
 
-    # Classify included locations as trusted vs untrusted
-    inc_trusted_locs = set()
-    inc_untrusted_locs = set()
+    # Classify included locations as trusted vs untrusted; only whether each kind
+    # is present matters. Unknown locations are conservatively treated as untrusted.
+    inc_trusted_locs = False
+    inc_untrusted_locs = False
 
     for loc_id in inc_locs:
-        if loc_id == "AllTrusted":
-            inc_trusted_locs.add(loc_id)
-        elif loc_id in location_trust_map:
-            if location_trust_map[loc_id]:
-                inc_trusted_locs.add(loc_id)
-            else:
-                inc_untrusted_locs.add(loc_id)
+        if loc_id == "AllTrusted" or location_trust_map.get(loc_id):
+            inc_trusted_locs = True
         else:
-            # Unknown location - conservatively treat as untrusted
-            inc_untrusted_locs.add(loc_id)
+            inc_untrusted_locs = True
 
     if is_from_trusted:
         # User is signing in from a trusted location
@@ -206,14 +221,8 @@ def _eval_trusted_location_condition(detail: Dict[str, Any], signin_ctx: SignInC
             # No matching inclusions
             return ConditionEval(matched=False, reason="Locations: no matching location inclusions")
 
-def _eval_user_risk_condition(detail: Dict[str, Any], signin_ctx: SignInContext) -> ConditionEval:
-    cond = (detail.get("Conditions", {}) or {})
-    ur = cond.get("UserRisks") or {}
-    include_blocks = ur.get("Include") or []
-
-    wanted: Set[str] = set()
-    for blk in include_blocks:
-        wanted.update([str(x).lower() for x in (blk.get("UserRisks") or [])])
+def _eval_user_risk_condition(shape: PolicyShape, signin_ctx: SignInContext) -> ConditionEval:
+    wanted = shape.user_risks
 
     if not wanted:
         return ConditionEval(matched=True, reason="UserRisk: no user risk condition present")
@@ -221,20 +230,14 @@ def _eval_user_risk_condition(detail: Dict[str, Any], signin_ctx: SignInContext)
     if signin_ctx.user_risk is None:
         return ConditionEval(matched=True, reason="UserRisk: scenario user_risk not provided", runtime_dependent=True)
 
-    got = str(signin_ctx.user_risk).lower()
+    got = signin_ctx.user_risk_lower
     if got in wanted:
-        return ConditionEval(matched=True, reason=f"UserRisk: matched ({got})")
-
-    return ConditionEval(matched=False, reason=f"UserRisk: did not match ({got})")
+        return ConditionEval(matched=True, reason="UserRisk: matched ({})", reason_arg=got)
 
-def _eval_auth_flow_condition(detail: Dict[str, Any], signin_ctx: SignInContext) -> ConditionEval:
-    cond = (detail.get("Conditions", {}) or {})
-    af = cond.get("AuthFlows") or {}
-    include_blocks = af.get("Include") or []
+    return ConditionEval(matched=False, reason="UserRisk: did not match ({})", reason_arg=got)
 
-    wanted: Set[str] = set()
-    for blk in include_blocks:
-        wanted.update([str(x).lower() for x in (blk.get("AuthFlows") or [])])
+def _eval_auth_flow_condition(shape: PolicyShape, signin_ctx: SignInContext) -> ConditionEval:
+    wanted = shape.auth_flows
 
     if not wanted:
         return ConditionEval(matched=True, reason="AuthFlow: no auth flow condition present")
@@ -242,14 +245,13 @@ def _eval_auth_flow_condition(detail: Dict[str, Any], signin_ctx: SignInContext)
     if signin_ctx.auth_flow is None:
         return ConditionEval(matched=True, reason="AuthFlow: scenario auth_flow not provided", runtime_dependent=True)
 
-    got = str(signin_ctx.auth_flow).lower()
+    got = signin_ctx.auth_flow_lower
     if got in wanted:
-        return ConditionEval(matched=True, reason=f"AuthFlow: matched ({got})")
+        return ConditionEval(matched=True, reason="AuthFlow: matched ({})", reason_arg=got)
 
-    return ConditionEval(matched=False, reason=f"AuthFlow: did not match ({got})")
+    return ConditionEval(matched=False, reason="AuthFlow: did not match ({})", reason_arg=got)
 
-def _policy_has_device_filter(detail: Dict[str, Any]) -> bool:
-    cond = (detail.get("Conditions", {}) or {})
+def _policy_has_device_filter(cond: Dict[str, Any]) -> bool:
     dev = cond.get("Devices") or {}
 
     flt = dev.get("Filter") or {}
@@ -263,8 +265,8 @@ def _policy_has_device_filter(detail: Dict[str, Any]) -> bool:
     return False
 
 
-def _eval_device_filter_condition(detail: Dict[str, Any], signin_ctx: SignInContext) -> ConditionEval:
-    if not _policy_has_device_filter(detail):
+def _eval_device_filter_condition(shape: PolicyShape, signin_ctx: SignInContext) -> ConditionEval:
+    if not shape.has_device_filter:
         return ConditionEval(matched=True, reason="DeviceFilter: no device filter condition present")
 
     if signin_ctx.device_filter is None:
@@ -274,30 +276,16 @@ def _eval_device_filter_condition(detail: Dict[str, Any], signin_ctx: SignInCont
         return ConditionEval(matched=True, reason="DeviceFilter: matched (true)")
     return ConditionEval(matched=False, reason="DeviceFilter: did not match (false)")
 
-def _eval_device_state_condition(detail: Dict[str, Any], signin_ctx: SignInContext) -> ConditionEval:
+def _eval_device_state_condition(shape: PolicyShape, signin_ctx: SignInContext) -> ConditionEval:
     """
     Evaluate device state conditions (compliance, hybrid joined, domain joined).
     Handles both Include and Exclude blocks.
     """
-    cond = (detail.get("Conditions", {}) or {})
-    device_states = cond.get("DeviceStates") or {}
-
-    if not device_states:
+    if not shape.has_device_states:
         return ConditionEval(matched=True, reason="DeviceState: no device state condition present")
 
-    include_blocks = device_states.get("Include") or []
-    exclude_blocks = device_states.get("Exclude") or []
-
-    inc_states: Set[str] = set()
-    exc_states: Set[str] = set()
-
-    for blk in include_blocks:
-        vals = blk.get("DeviceStates") or []
-        inc_states.update(str(v).lower() for v in vals)
-
-    for blk in exclude_blocks:
-        vals = blk.get("DeviceStates") or []
-        exc_states.update(str(v).lower() for v in vals)
+    inc_states = shape.inc_device_states
+    exc_states = shape.exc_device_states
 
     if not inc_states and not exc_states:
         return ConditionEval(matched=True, reason="DeviceState: no device state requirements")
@@ -307,8 +295,8 @@ def _eval_device_state_condition(detail: Dict[str, Any], signin_ctx: SignInConte
     has_joined_signal = signin_ctx.device_hybrid_joined is not None
 
     # Determine what states are being checked
-    checks_compliant = "compliant" in inc_states or "compliant" in exc_states
-    checks_joined = any(x in inc_states or x in exc_states for x in ["domainjoined", "hybridazureaadjoined"])
+    checks_compliant = shape.inc_compliant or shape.exc_compliant
+    checks_joined = shape.inc_joined or shape.exc_joined
 
     # If policy checks states we don't have signals for, return runtime-dependent
     if checks_compliant and not has_compliant_signal:
@@ -318,15 +306,12 @@ def _eval_device_state_condition(detail: Dict[str, Any], signin_ctx: SignInConte
 
     # FIRST: Check exclusions - if device matches an exclusion, policy does NOT apply
     if exc_states:
-        if signin_ctx.device_compliant is True and "compliant" in exc_states:
+        if signin_ctx.device_compliant is True and shape.exc_compliant:
             return ConditionEval(matched=False, reason="DeviceState: device is compliant, policy excludes compliant devices")
-        if signin_ctx.device_compliant is False and any(x in exc_states for x in ["noncompliant", "non-compliant"]):
+        if signin_ctx.device_compliant is False and shape.exc_noncompliant:
             return ConditionEval(matched=False, reason="DeviceState: device is non-compliant, policy excludes non-compliant devices")
-        if signin_ctx.device_hybrid_joined is True and any(x in exc_states for x in ["domainjoined", "hybridazureaadjoined"]):
+        if signin_ctx.device_hybrid_joined is True and shape.exc_joined:
             return ConditionEval(matched=False, reason="DeviceState: device is hybrid joined, policy excludes joined devices")
-        if signin_ctx.device_hybrid_joined is False and not any(x in exc_states for x in ["domainjoined", "hybridazureaadjoined"]):
-            # Device is not joined, and exclusion is not for joined devices
-            pass
 
     # SECOND: Check inclusions - if device matches an inclusion, policy applies
     if not inc_states:
@@ -337,7 +322,7 @@ def _eval_device_state_condition(detail: Dict[str, Any], signin_ctx: SignInConte
     matched = False
     reason_parts = []
 
-    if "compliant" in inc_states:
+    if shape.inc_compliant:
         if signin_ctx.device_compliant is True:
             matched = True
             reason_parts.append("device is compliant")
@@ -345,7 +330,7 @@ def _eval_device_state_condition(detail: Dict[str, Any], signin_ctx: SignInConte
             reason_parts.append("policy requires compliant device, but device is non-compliant")
             return ConditionEval(matched=False, reason=f"DeviceState: {', '.join(reason_parts)}")
 
-    if any(x in inc_states for x in ["domainjoined", "hybridazureaadjoined"]):
+    if shape.inc_joined:
         if signin_ctx.device_hybrid_joined is True:
             matched = True
             reason_parts.append("device is hybrid joined")
@@ -361,8 +346,7 @@ def _eval_device_state_condition(detail: Dict[str, Any], signin_ctx: SignInConte
     return ConditionEval(matched=False, reason="DeviceState: device state does not match policy requirements")
 
 
-def _extract_platforms(detail: Dict[str, Any]) -> Tuple[Set[str], Set[str]]:
-    cond = (detail.get("Conditions", {}) or {})
+def _extract_platforms(cond: Dict[str, Any]) -> Tuple[Set[str], Set[str]]:
 
     # Graph-style
     plats = cond.get("Platforms") or {}
@@ -389,74 +373,82 @@ def _extract_platforms(detail: Dict[str, Any]) -> Tuple[Set[str], Set[str]]:
     return inc, exc
 
 
-def _eval_platform_condition(detail: Dict[str, Any], signin_ctx: SignInContext) -> ConditionEval:
-    inc, exc = _extract_platforms(detail)
+_PLATFORM_NO_COND = ConditionEval(matched=True, reason="Platform: no platform condition present")
+_PLATFORM_NOT_PROVIDED = ConditionEval(matched=True, reason="Platform: scenario platform not provided", runtime_dependent=True)
+_PLATFORM_INC_ALL = ConditionEval(matched=True, reason="Platform: included All (and not excluded)")
+_PLATFORM_IMPLICIT_ALL = ConditionEval(matched=True, reason="Platform: not excluded (implicit All)")
+
+
+def _platform_no_condition(shape: PolicyShape, p: Optional[str]) -> ConditionEval:
+    return _PLATFORM_NO_COND
 
-    # No platform condition at all
-    if not inc and not exc:
-        return ConditionEval(matched=True, reason="Platform: no platform condition present")
 
+def _platform_not_provided(shape: PolicyShape, p: Optional[str]) -> ConditionEval:
     # Condition exists but scenario didn’t provide platform
-    if signin_ctx.platform is None:
-        return ConditionEval(matched=True, reason="Platform: scenario platform not provided", runtime_dependent=True)
+    return _PLATFORM_NOT_PROVIDED
 
-    p = str(signin_ctx.platform).strip().lower()
 
+def _platform_include(shape: PolicyShape, p: Optional[str]) -> ConditionEval:
+    inc = shape.inc_platforms
     # Exclusions win
-    if p in exc:
-        return ConditionEval(matched=False, reason=f"Platform: excluded platform matched ({p})")
-
+    if p in shape.exc_platforms:
+        return ConditionEval(matched=False, reason="Platform: excluded platform matched ({})", reason_arg=p)
     # Include=All means “everything except excluded”
     if "all" in inc:
-        return ConditionEval(matched=True, reason="Platform: included All (and not excluded)")
+        return _PLATFORM_INC_ALL
+    if p in inc:
+        return ConditionEval(matched=True, reason="Platform: included platform matched ({})", reason_arg=p)
+    return ConditionEval(matched=False, reason="Platform: platform did not match include list ({})", reason_arg=p)
 
-    # If include list exists, must match
-    if inc:
-        if p in inc:
-            return ConditionEval(matched=True, reason=f"Platform: included platform matched ({p})")
-        return ConditionEval(matched=False, reason=f"Platform: platform did not match include list ({p})")
 
+def _platform_exclude_only(shape: PolicyShape, p: Optional[str]) -> ConditionEval:
+    if p in shape.exc_platforms:
+        return ConditionEval(matched=False, reason="Platform: excluded platform matched ({})", reason_arg=p)
     # If only excludes exist, treat includes as All
-    return ConditionEval(matched=True, reason="Platform: not excluded (implicit All)")
+    return _PLATFORM_IMPLICIT_ALL
 
-def _eval_client_app_condition(detail: Dict[str, Any], signin_ctx: SignInContext) -> ConditionEval:
-    cond = (detail.get("Conditions", {}) or {})
 
-    # Graph-style
-    cats = cond.get("ClientAppTypes") or []
+def _platform_handler(no_platform: bool, has_inc: bool, has_exc: bool):
+    if not has_inc and not has_exc:
+        return _platform_no_condition
+    if no_platform:
+        return _platform_not_provided
+    return _platform_include if has_inc else _platform_exclude_only
 
-    # ROADrecon-style
-    ct = cond.get("ClientTypes") or {}
-    if ct:
-        cats = []
-        for blk in (ct.get("Include") or []):
-            cats.extend(blk.get("ClientTypes") or [])
 
-    if not cats:
+# (platform is None, has include list, has exclude list) -> handler
+_PLATFORM_HANDLERS = {
+    key: _platform_handler(*key)
+    for key in itertools.product((False, True), repeat=3)
+}
+
+
+def _eval_platform_condition(shape: PolicyShape, signin_ctx: SignInContext) -> ConditionEval:
+    handler = _PLATFORM_HANDLERS[
+        (signin_ctx.platform is None, bool(shape.inc_platforms), bool(shape.exc_platforms))
+    ]
+    return handler(shape, signin_ctx.platform_lower)
+
+def _eval_client_app_condition(shape: PolicyShape, signin_ctx: SignInContext) -> ConditionEval:
+    if not shape.has_client_apps:
         return ConditionEval(matched=True, reason="ClientApp: no client app type condition present")
 
     if signin_ctx.client_app is None:
         return ConditionEval(matched=True, reason="ClientApp: scenario client_app not provided", runtime_dependent=True)
 
-    wanted = set([str(x).strip().lower() for x in cats if x])
-    got = str(signin_ctx.client_app).strip().lower()
+    wanted = shape.client_apps
+    got = signin_ctx.client_app_lower
 
     if "all" in wanted:
         return ConditionEval(matched=True, reason="ClientApp: includes All")
 
     if got in wanted:
-        return ConditionEval(matched=True, reason=f"ClientApp: matched ({got})")
+        return ConditionEval(matched=True, reason="ClientApp: matched ({})", reason_arg=got)
 
-    return ConditionEval(matched=False, reason=f"ClientApp: did not match ({got})")
+    return ConditionEval(matched=False, reason="ClientApp: did not match ({})", reason_arg=got)
 
-def _eval_signin_risk_condition(detail: Dict[str, Any], signin_ctx: SignInContext) -> ConditionEval:
-    cond = (detail.get("Conditions", {}) or {})
-    sir = cond.get("SignInRisks") or {}
-    include_blocks = sir.get("Include") or []
-
-    wanted: Set[str] = set()
-    for blk in include_blocks:
-        wanted.update([str(x).lower() for x in (blk.get("SignInRisks") or [])])
+def _eval_signin_risk_condition(shape: PolicyShape, signin_ctx: SignInContext) -> ConditionEval:
+    wanted = shape.signin_risks
 
     if not wanted:
         return ConditionEval(matched=True, reason="SignInRisk: no sign-in risk condition present")
@@ -464,34 +456,201 @@ def _eval_signin_risk_condition(detail: Dict[str, Any], signin_ctx: SignInContex
     if signin_ctx.signin_risk is None:
         return ConditionEval(matched=True, reason="SignInRisk: scenario signin_risk not provided", runtime_dependent=True)
 
-    got = str(signin_ctx.signin_risk).lower()
+    got = signin_ctx.signin_risk_lower
     if got in wanted:
-        return ConditionEval(matched=True, reason=f"SignInRisk: matched ({got})")
+        return ConditionEval(matched=True, reason="SignInRisk: matched ({})", reason_arg=got)
+
+    return ConditionEval(matched=False, reason="SignInRisk: did not match ({})", reason_arg=got)
+
+def _client_app_types(cond: Dict[str, Any]) -> List[Any]:
+    # Graph-style
+    cats = cond.get("ClientAppTypes") or []
+
+    # ROADrecon-style
+    ct = cond.get("ClientTypes") or {}
+    if ct:
+        cats = []
+        for blk in (ct.get("Include") or []):
+            cats.extend(blk.get("ClientTypes") or [])
+    return cats
+
+
+def _include_values(cond: Dict[str, Any], name: str) -> FrozenSet[str]:
+    # Lowercased values of the Include blocks of a UserRisks/SignInRisks/AuthFlows condition
+    wanted: Set[str] = set()
+    for blk in ((cond.get(name) or {}).get("Include") or []):
+        wanted.update([str(x).lower() for x in (blk.get(name) or [])])
+    return _interned(wanted)
+
+
+def _interned(values: Iterable[Any]) -> FrozenSet[Any]:
+    # Scenario strings are interned too (see SignInContext), so set lookups
+    # mostly hit on identity before comparing characters.
+    return frozenset(intern_str(v) for v in values)
+
+
+def _add_controls(out: Dict[str, None], value: Any) -> None:
+    if isinstance(value, list):
+        for n in value:
+            if n:
+                out[n] = None
+    elif isinstance(value, str) and value:
+        out[value] = None
 
-    return ConditionEval(matched=False, reason=f"SignInRisk: did not match ({got})")
 
-def evaluate_conditions(detail: Dict[str, Any], signin_ctx: SignInContext, location_trust_map: Dict[str, bool] = None) -> Tuple[bool, List[str], List[str]]:
-    policy_mode = _policy_target_mode(detail)
+def policy_controls(detail: Dict[str, Any]) -> List[str]:
+    # Dict keys keep first-seen order, so this de-duplicates in the same pass.
+    out: Dict[str, None] = {}
 
-    evals: List[ConditionEval] = []
-    evals.append(_eval_app_condition(detail, signin_ctx, policy_mode))
-    evals.append(_eval_acr_condition(detail, signin_ctx, policy_mode))
-    evals.append(_eval_trusted_location_condition(detail, signin_ctx, location_trust_map))
-    evals.append(_eval_device_state_condition(detail, signin_ctx))
-    evals.append(_eval_platform_condition(detail, signin_ctx))
-    evals.append(_eval_client_app_condition(detail, signin_ctx))
-    evals.append(_eval_signin_risk_condition(detail, signin_ctx))
-    evals.append(_eval_user_risk_condition(detail, signin_ctx))
-    evals.append(_eval_auth_flow_condition(detail, signin_ctx))
-    evals.append(_eval_device_filter_condition(detail, signin_ctx))
+    for blk in detail.get("Controls") or []:
+        _add_controls(out, blk.get("Control"))
+
+        auth_strength_ids = blk.get("AuthStrengthIds") or []
+        if isinstance(auth_strength_ids, list) and len(auth_strength_ids) > 0:
+            out["AuthStrength"] = None
+
+        _add_controls(out, blk.get("GrantControls"))
+        _add_controls(out, blk.get("SessionControls"))
+
+    return list(out)
+
+
+def controls_effect(controls: List[str]) -> str:
+    if "block" in [str(c).lower() for c in controls]:
+        return "Block"
+    return "Grant" if controls else "Unknown"
+
+
+def build_policy_shape(detail: Dict[str, Any]) -> PolicyShape:
+    """
+    Extract the condition sets of a policy detail once, so the evaluators only do
+    set membership tests per scenario.
+    """
+    # Every condition helper reads from this one Conditions dict
+    cond = detail.get("Conditions") or {}
+
+    inc_apps, exc_apps = _get_apps_from_condition(cond)
+    policy_acrs = _get_acrs_from_condition(cond)
+
+    locs = cond.get("Locations") or {}
+    inc_locs: Set[str] = set()
+    exc_locs: Set[str] = set()
+    for blk in (locs.get("Include") or []):
+        inc_locs.update(blk.get("Locations", []) or [])
+    for blk in (locs.get("Exclude") or []):
+        exc_locs.update(blk.get("Locations", []) or [])
+
+    device_states = cond.get("DeviceStates") or {}
+    inc_states: Set[str] = set()
+    exc_states: Set[str] = set()
+    for blk in (device_states.get("Include") or []):
+        inc_states.update(str(v).lower() for v in (blk.get("DeviceStates") or []))
+    for blk in (device_states.get("Exclude") or []):
+        exc_states.update(str(v).lower() for v in (blk.get("DeviceStates") or []))
+
+    # Device state names checked by _eval_device_state_condition
+    joined = ("domainjoined", "hybridazureaadjoined")
+
+    inc_plats, exc_plats = _extract_platforms(cond)
+    cats = _client_app_types(cond)
+
+    controls = policy_controls(detail)
+
+    return PolicyShape(
+        mode="user_action" if policy_acrs else "cloud_app",
+        inc_apps=_interned(inc_apps),
+        exc_apps=_interned(exc_apps),
+        policy_acrs=_interned(policy_acrs),
+        has_locations=bool(locs),
+        inc_locs=_interned(inc_locs),
+        exc_locs=_interned(exc_locs),
+        has_device_states=bool(device_states),
+        inc_device_states=_interned(inc_states),
+        exc_device_states=_interned(exc_states),
+        inc_compliant="compliant" in inc_states,
+        inc_joined=any(x in inc_states for x in joined),
+        exc_compliant="compliant" in exc_states,
+        exc_noncompliant=any(x in exc_states for x in ("noncompliant", "non-compliant")),
+        exc_joined=any(x in exc_states for x in joined),
+        inc_platforms=_interned(inc_plats),
+        exc_platforms=_interned(exc_plats),
+        has_client_apps=bool(cats),
+        client_apps=_interned(str(x).strip().lower() for x in cats if x),
+        signin_risks=_include_values(cond, "SignInRisks"),
+        user_risks=_include_values(cond, "UserRisks"),
+        auth_flows=_include_values(cond, "AuthFlows"),
+        has_device_filter=_policy_has_device_filter(cond),
+        controls=tuple(controls),
+        effect=controls_effect(controls),
+    )
+
+
+def referenced_signals(shape: PolicyShape) -> Set[str]:
+    """
+    Return the permutable sign-in signals (SignInContext field names) that this
+    policy's conditions actually inspect. Signals not returned cannot change the
+    outcome of evaluate_conditions for this policy.
+    """
+    signals: Set[str] = set()
+
+    if shape.inc_platforms or shape.exc_platforms:
+        signals.add("platform")
+    if shape.has_client_apps:
+        signals.add("client_app")
+    if shape.signin_risks:
+        signals.add("signin_risk")
+    if shape.user_risks:
+        signals.add("user_risk")
+    if shape.auth_flows:
+        signals.add("auth_flow")
+    if shape.has_device_filter:
+        signals.add("device_filter")
+    if shape.has_locations:
+        signals.add("trusted_location")
+
+    return signals
+
+# Condition evaluators in evaluation order. Each takes
+# (shape, signin_ctx, location_trust_map).
+_EVALUATORS = (
+    lambda shape, ctx, locs: _eval_app_condition(shape, ctx),
+    lambda shape, ctx, locs: _eval_acr_condition(shape, ctx),
+    _eval_trusted_location_condition,
+    lambda shape, ctx, locs: _eval_device_state_condition(shape, ctx),
+    lambda shape, ctx, locs: _eval_platform_condition(shape, ctx),
+    lambda shape, ctx, locs: _eval_client_app_condition(shape, ctx),
+    lambda shape, ctx, locs: _eval_signin_risk_condition(shape, ctx),
+    lambda shape, ctx, locs: _eval_user_risk_condition(shape, ctx),
+    lambda shape, ctx, locs: _eval_auth_flow_condition(shape, ctx),
+    lambda shape, ctx, locs: _eval_device_filter_condition(shape, ctx),
+)
+
+def evaluate_conditions(
+    detail: Dict[str, Any],
+    signin_ctx: SignInContext,
+    location_trust_map: Dict[str, bool] = None,
+    fast_fail: bool = False,
+    shape: Optional[PolicyShape] = None,
+) -> Tuple[bool, List[str], List[str]]:
+    """
+    Evaluate every condition of a policy against the scenario. With fast_fail the
+    evaluation stops at the first blocker, so the blockers and runtime notes are
+    incomplete; use it when only the boolean outcome matters. Pass the shape built
+    when the policies were loaded to avoid re-extracting it from detail.
+    """
+    if shape is None:
+        shape = build_policy_shape(detail)
 
     blockers: List[str] = []
     runtime_notes: List[str] = []
 
-    for e in evals:
+    for fn in _EVALUATORS:
+        e = fn(shape, signin_ctx, location_trust_map)
         if not e.matched:
-            blockers.append(e.reason)
+            blockers.append(e.text())
+            if fast_fail:
+                return False, blockers, runtime_notes
         elif e.runtime_dependent:
-            runtime_notes.append(e.reason)
+            runtime_notes.append(e.text())
 
     return (len(blockers) == 0), blockers, runtime_notes
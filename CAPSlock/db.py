@@ -1,14 +1,38 @@
 from __future__ import annotations
 import json
 import os
-from typing import Any, Dict, List
-from sqlalchemy.orm import sessionmaker
+from typing import Any, Dict, Iterator, List
+from sqlalchemy import event, text
+from sqlalchemy.orm import load_only, sessionmaker
 from roadtools.roadlib.metadef import database
-from roadtools.roadlib.metadef.database import Policy
+from roadtools.roadlib.metadef.database import Policy, User
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
 
 
 DB_PATH = "roadrecon.db"
 
+# Read-heavy analysis settings applied to every new SQLite connection. Only
+# connection-local pragmas: the DB file itself is never modified.
+_SQLITE_PRAGMAS = (
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
+)
+
+# Lookup indexes roadrecon does not create itself. Only created on request by
+# create_indexes (the index-db command); the analysis commands never write to the DB.
+_SQLITE_INDEXES = (
+    # Every policy load filters on policyType (18 = CA policies, 6 = named locations)
+    ("ix_policy_policyType", f"CREATE INDEX IF NOT EXISTS ix_policy_policyType ON {Policy.__tablename__} (policyType)"),
+    # Case-insensitive UPN lookups compare lower(userPrincipalName)
+    ("ix_user_upn_lower", f"CREATE INDEX IF NOT EXISTS ix_user_upn_lower ON {User.__tablename__} (lower(userPrincipalName))"),
+)
+
 
 def get_engine(db_path: str = DB_PATH):
     if not os.path.isabs(db_path):
@@ -16,7 +40,45 @@ def get_engine(db_path: str = DB_PATH):
     else:
         dburl = f"sqlite:///{db_path}"
 
-    return database.init(False, dburl=dburl)
+    engine = database.init(False, dburl=dburl)
+    _install_sqlite_pragmas(engine)
+    return engine
+
+
+def _install_sqlite_pragmas(engine) -> None:
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        try:
+            for pragma in _SQLITE_PRAGMAS:
+                try:
+                    cursor.execute(pragma)
+                except Exception:
+                    # Unsupported by this SQLite build: keep the default
+                    pass
+        finally:
+            cursor.close()
+
+
+def create_indexes(db_path: str = DB_PATH) -> List[str]:
+    """
+    Add the lookup indexes in _SQLITE_INDEXES to an existing roadrecon.db and return
+    their names. This modifies the DB file, so it is only run when explicitly asked.
+    """
+    if not os.path.isfile(db_path):
+        raise FileNotFoundError(f"Database not found: {db_path}")
+
+    engine = get_engine(db_path)
+    try:
+        with engine.begin() as conn:
+            for _, ddl in _SQLITE_INDEXES:
+                conn.execute(text(ddl))
+    finally:
+        engine.dispose()
+    return [name for name, _ in _SQLITE_INDEXES]
 
 
 def get_session(db_path: str = DB_PATH):
@@ -26,7 +88,24 @@ def get_session(db_path: str = DB_PATH):
 
 def load_capolicies(session) -> List[Policy]:
     # policyType == 18 => Conditional Access
-    return session.query(Policy).filter(Policy.policyType == 18).all()
+    return (
+        session.query(Policy)
+        .options(load_only(Policy.objectId, Policy.displayName, Policy.policyDetail))
+        .filter(Policy.policyType == 18)
+        .all()
+    )
+
+
+def iter_capolicies(session, batch_size: int = 200) -> Iterator[Any]:
+    """
+    Stream Conditional Access policies in batches, loading only the columns the
+    evaluator reads. Rows expose objectId, displayName and policyDetail like a Policy.
+    """
+    return (
+        session.query(Policy.objectId, Policy.displayName, Policy.policyDetail)
+        .filter(Policy.policyType == 18)
+        .yield_per(batch_size)
+    )
 
 
 def parse_policy_details(policy: Policy) -> List[Dict[str, Any]]:
@@ -36,12 +115,27 @@ def parse_policy_details(policy: Policy) -> List[Dict[str, Any]]:
 
     for raw in policy.policyDetail:
         try:
-            details.append(json.loads(raw))
+            details.append(_loads(raw))
         except Exception as e:
             print(f"[!] Failed to parse policyDetail for {policy.displayName}: {e}")
     return details
 
 
+# One row per named location: (objectId, 1 if any detail lists "trusted" in Categories)
+_NAMED_LOCATION_TRUST_SQL = text(f"""
+    SELECT p.objectId,
+           EXISTS (
+               SELECT 1
+               FROM json_each(p.policyDetail) AS pd,
+                    json_each(json_extract(pd.value, '$.Categories')) AS cat
+               WHERE json_type(pd.value, '$.Categories') = 'array'
+                 AND lower(cat.value) = 'trusted'
+           )
+    FROM {Policy.__tablename__} AS p
+    WHERE p.policyType = 6
+""")
+
+
 def load_named_locations(session) -> Dict[str, bool]:
     """
     Load named locations from the database and return a map of location_id -> is_trusted.
@@ -49,20 +143,37 @@ def load_named_locations(session) -> Dict[str, bool]:
     policyType == 6 => Named Locations
     A location is trusted if "trusted" is in the Categories array of its detail.
 
+    The check runs inside SQLite with the JSON1 functions; if that fails (no JSON1,
+    or a detail that is not valid JSON) the details are parsed in Python instead.
+
     Returns:
         Dict mapping location objectId to boolean indicating if it's trusted
     """
+    try:
+        rows = session.execute(_NAMED_LOCATION_TRUST_SQL).all()
+    except Exception:
+        return _load_named_locations_py(session)
+
+    return {object_id: bool(is_trusted) for object_id, is_trusted in rows}
+
+
+def _load_named_locations_py(session) -> Dict[str, bool]:
     location_trust_map: Dict[str, bool] = {}
 
     try:
-        locations = session.query(Policy).filter(Policy.policyType == 6).all()
+        locations = (
+            session.query(Policy)
+            .options(load_only(Policy.objectId, Policy.policyDetail))
+            .filter(Policy.policyType == 6)
+            .all()
+        )
 
         for loc in locations:
             is_trusted = False
             if loc.policyDetail:
                 for detail_raw in loc.policyDetail:
                     try:
-                        detail = json.loads(detail_raw)
+                        detail = _loads(detail_raw)
                         categories = detail.get("Categories", []) or []
                         if "trusted" in [str(c).lower() for c in categories]:
                             is_trusted = True
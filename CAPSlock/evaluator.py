@@ -1,9 +1,9 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Set, Optional
+from typing import Any, Dict, Optional
 from roadtools.roadlib.metadef.database import Policy
-from CAPSlock.models import PolicyResult, UserContext, SignInContext
+from CAPSlock.models import PolicyResult, PolicyShape, UserContext, SignInContext
 from CAPSlock.targeting import evaluate_user_targeting
-from CAPSlock.conditions import evaluate_conditions
+from CAPSlock.conditions import build_policy_shape, controls_effect, evaluate_conditions, policy_controls
 
 def evaluate_policy_detail(
     policy: Policy,
@@ -13,6 +13,7 @@ def evaluate_policy_detail(
     mode: str = "get-policies",
     resolver: Optional[object] = None,
     location_trust_map: Optional[Dict[str, bool]] = None,
+    shape: Optional[PolicyShape] = None,
 ) -> PolicyResult:
     state = detail.get("State")
 
@@ -40,13 +41,12 @@ def evaluate_policy_detail(
         )
 
     if mode == "get-policies":
-        controls = _policy_controls(detail)
-        effect = "Unknown"
-        normalized_controls = [c.lower() for c in controls]
-        if "block" in normalized_controls:
-            effect = "Block"
-        elif controls:
-            effect = "Grant"
+        # Only the grant controls are needed; conditions are not evaluated here
+        if shape is not None:
+            effect, controls = shape.effect, list(shape.controls)
+        else:
+            controls = policy_controls(detail)
+            effect = controls_effect(controls)
 
         return PolicyResult(
             applies=True,
@@ -58,7 +58,36 @@ def evaluate_policy_detail(
             applies_reason=tgt.applies_reason,
         )
 
-    matched_all, blockers, runtime_notes = evaluate_conditions(detail, signin_ctx, location_trust_map)
+    return evaluate_targeted_conditions(
+        policy=policy,
+        detail=detail,
+        state=state,
+        targeting_reason=tgt.applies_reason,
+        signin_ctx=signin_ctx,
+        location_trust_map=location_trust_map,
+        shape=shape,
+    )
+
+
+def evaluate_targeted_conditions(
+    policy: Policy,
+    detail: Dict[str, Any],
+    state: str,
+    targeting_reason: str,
+    signin_ctx: SignInContext,
+    location_trust_map: Optional[Dict[str, bool]] = None,
+    fast_fail: bool = False,
+    shape: Optional[PolicyShape] = None,
+) -> PolicyResult:
+    """
+    Evaluate the sign-in conditions of a policy whose state and user targeting
+    already matched, and build its what-if PolicyResult. With fast_fail a
+    non-applicable result only names the first blocking condition.
+    """
+    if shape is None:
+        shape = build_policy_shape(detail)
+
+    matched_all, blockers, runtime_notes = evaluate_conditions(detail, signin_ctx, location_trust_map, fast_fail=fast_fail, shape=shape)
     if not matched_all:
         reason = "Not applicable: " + "; ".join(blockers[:3]) + ("..." if len(blockers) > 3 else "")
         return PolicyResult(
@@ -71,64 +100,19 @@ def evaluate_policy_detail(
             applies_reason=reason,
         )
 
-    controls = _policy_controls(detail)
-    effect = "Unknown"
-    normalized_controls = [c.lower() for c in controls]
-    if "block" in normalized_controls:
-        effect = "Block"
-    elif controls:
-        effect = "Grant"
-
     if runtime_notes:
         note = " | Signal-dependent: " + ", ".join(runtime_notes[:2]) + ("..." if len(runtime_notes) > 2 else "")
-        reason = tgt.applies_reason + note
+        reason = targeting_reason + note
     else:
-        reason = tgt.applies_reason
+        reason = targeting_reason
 
     return PolicyResult(
         applies=True,
-        effect=effect,
-        controls=controls,
+        effect=shape.effect,
+        controls=list(shape.controls),
         state=state,
         policy=policy,
         detail=detail,
         applies_reason=reason,
+        signal_dependent=bool(runtime_notes),
     )
-
-def _policy_controls(detail: Dict[str, Any]) -> List[str]:
-    controls_blocks = detail.get("Controls") or []
-    names: List[str] = []
-
-    for blk in controls_blocks:
-        ctrl = blk.get("Control") or []
-        if isinstance(ctrl, list):
-            names.extend(ctrl)
-        elif isinstance(ctrl, str):
-            names.append(ctrl)
-
-        auth_strength_ids = blk.get("AuthStrengthIds") or []
-        if isinstance(auth_strength_ids, list) and len(auth_strength_ids) > 0:
-            names.append("AuthStrength")
-
-        grant = blk.get("GrantControls") or []
-        if isinstance(grant, list):
-            names.extend(grant)
-        elif isinstance(grant, str):
-            names.append(grant)
-
-        sess = blk.get("SessionControls") or []
-        if isinstance(sess, list):
-            names.extend(sess)
-        elif isinstance(sess, str):
-            names.append(sess)
-
-    seen: Set[str] = set()
-    out: List[str] = []
-    for n in names:
-        if not n:
-            continue
-        if n not in seen:
-            out.append(n)
-            seen.add(n)
-
-    return out
@@ -1,8 +1,38 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Set
-
-@dataclass
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
+
+
+def intern_str(value: Any) -> Any:
+    # JSON decoders do not intern strings; interning both the policy and the
+    # scenario side lets set lookups match on identity. Non-strings pass through.
+    return sys.intern(value) if type(value) is str else value
+
+
+# Known values of the enumerated sign-in signals (CLI choices and analyze
+# permutations) mapped to their interned lowercase form, so the common inputs
+# skip str/strip/lower/intern on every SignInContext.
+_SIGNAL_LOWER: Dict[str, str] = {
+    v: sys.intern(v.lower())
+    for v in (
+        "windows", "macos", "linux", "ios", "android",
+        "browser", "mobileAppsAndDesktopClients", "exchangeActiveSync", "other",
+        "none", "low", "medium", "high",
+        "devicecodeflow", "authtransfer",
+    )
+}
+
+
+def _signal_lower(value: Any, strip: bool) -> str:
+    if type(value) is str:
+        hit = _SIGNAL_LOWER.get(value)
+        if hit is not None:
+            return hit
+    value = str(value)
+    return sys.intern((value.strip() if strip else value).lower())
+
+@dataclass(slots=True)
 class UserContext:
     user: User
     object_id: str
@@ -10,8 +40,26 @@ class UserContext:
     role_object_ids: Set[str]
     role_template_ids: Set[str]
 
+    # Id sets matched against policy include/exclude lists, built once per user
+    effective_groups: FrozenSet[str] = field(default=frozenset(), init=False, repr=False, compare=False)
+    effective_roles: FrozenSet[str] = field(default=frozenset(), init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.effective_groups = frozenset(self.groups)
+        self.effective_roles = frozenset(self.role_object_ids | self.role_template_ids)
+
 
-@dataclass
+@dataclass(slots=True)
+class UserPolicies:
+    # Everything loaded from the DB to evaluate one user's policies offline
+    user_ctx: UserContext
+    # Shape is None when the detail's conditions could not be extracted
+    details: List[Tuple[Policy, Dict[str, Any], Optional[PolicyShape]]]
+    location_trust_map: Dict[str, bool]
+    resolver: Optional[NameResolver] = None
+
+
+@dataclass(slots=True)
 class SignInContext:
     # App / resource
     app_id: Optional[str] = None   
@@ -38,8 +86,29 @@ class SignInContext:
     # Device filter (bool)
     device_filter: Optional[bool] = None
 
-
-@dataclass
+    # Lowercased copies of the string signals, matched against PolicyShape sets
+    platform_lower: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    client_app_lower: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    signin_risk_lower: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    user_risk_lower: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    auth_flow_lower: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.app_id = intern_str(self.app_id)
+        self.acr = intern_str(self.acr)
+        if self.platform is not None:
+            self.platform_lower = _signal_lower(self.platform, True)
+        if self.client_app is not None:
+            self.client_app_lower = _signal_lower(self.client_app, True)
+        if self.signin_risk is not None:
+            self.signin_risk_lower = _signal_lower(self.signin_risk, False)
+        if self.user_risk is not None:
+            self.user_risk_lower = _signal_lower(self.user_risk, False)
+        if self.auth_flow is not None:
+            self.auth_flow_lower = _signal_lower(self.auth_flow, False)
+
+
+@dataclass(slots=True)
 class PolicyResult:
     applies: bool
     effect: str
@@ -49,8 +118,14 @@ class PolicyResult:
     detail: Dict[str, Any]
     applies_reason: str
 
+    # True when the policy applies only if runtime signals not supplied in the scenario match
+    signal_dependent: bool = False
 
-@dataclass
+    # Lowercased controls, filled on first use by the analyze gap checks
+    controls_lower: Optional[FrozenSet[str]] = field(default=None, init=False, repr=False, compare=False)
+
+
+@dataclass(slots=True)
 class NameResolver:
     group_names_by_id: Dict[str, str]
     role_names_by_template_id: Dict[str, str]
@@ -68,27 +143,67 @@ class NameResolver:
         return f"{name} ({rid})" if name else rid
 
 
-@dataclass
+@dataclass(slots=True)
 class TargetingResult:
     status: str
     applies_reason: str
     include_via: str = ""
     exclude_via: str = ""
-    matched_include_users: List[str] = None
-    matched_include_groups: List[str] = None
-    matched_include_roles: List[str] = None
-    matched_exclude_users: List[str] = None
-    matched_exclude_groups: List[str] = None
-    matched_exclude_roles: List[str] = None
+    # Lists when populated, shared empty tuples otherwise; treat as read-only
+    matched_include_users: Sequence[str] = None
+    matched_include_groups: Sequence[str] = None
+    matched_include_roles: Sequence[str] = None
+    matched_exclude_users: Sequence[str] = None
+    matched_exclude_groups: Sequence[str] = None
+    matched_exclude_roles: Sequence[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class ConditionEval:
     matched: bool
     reason: str
     runtime_dependent: bool = False
 
-@dataclass
+    # When set, reason is a str.format template; text() fills it in on demand so
+    # matched conditions never pay for formatting a reason nobody reads
+    reason_arg: Any = None
+
+    def text(self) -> str:
+        if self.reason_arg is None:
+            return self.reason
+        return self.reason.format(self.reason_arg)
+
+
+@dataclass(frozen=True, slots=True)
+class PolicyShape:
+    # Condition sets extracted once from a policy detail for the condition evaluators
+    mode: str
+    inc_apps: FrozenSet[str]
+    exc_apps: FrozenSet[str]
+    policy_acrs: FrozenSet[str]
+    has_locations: bool
+    inc_locs: FrozenSet[str]
+    exc_locs: FrozenSet[str]
+    has_device_states: bool
+    inc_device_states: FrozenSet[str]
+    exc_device_states: FrozenSet[str]
+    inc_compliant: bool
+    inc_joined: bool
+    exc_compliant: bool
+    exc_noncompliant: bool
+    exc_joined: bool
+    inc_platforms: FrozenSet[str]
+    exc_platforms: FrozenSet[str]
+    has_client_apps: bool
+    client_apps: FrozenSet[str]
+    signin_risks: FrozenSet[str]
+    user_risks: FrozenSet[str]
+    auth_flows: FrozenSet[str]
+    has_device_filter: bool
+    controls: Tuple[str, ...]
+    effect: str
+
+@dataclass(slots=True)
 class UserContext:
     user: User
     object_id: str
@@ -96,8 +211,16 @@ class UserContext:
     role_object_ids: Set[str]
     role_template_ids: Set[str]
 
+    # Id sets matched against policy include/exclude lists, built once per user
+    effective_groups: FrozenSet[str] = field(default=frozenset(), init=False, repr=False, compare=False)
+    effective_roles: FrozenSet[str] = field(default=frozenset(), init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.effective_groups = frozenset(self.groups)
+        self.effective_roles = frozenset(self.role_object_ids | self.role_template_ids)
+
 
-@dataclass
+@dataclass(slots=True)
 class NameResolver:
     group_names_by_id: Dict[str, str]
     role_names_by_template_id: Dict[str, str]
@@ -2,25 +2,29 @@ from __future__ import annotations
 from typing import Optional
 
 
+_TRUE_STRINGS = frozenset(("true", "t", "1", "yes", "y"))
+_FALSE_STRINGS = frozenset(("false", "f", "0", "no", "n"))
+_UNKNOWN_STRINGS = frozenset(("unknown", "unset", "none"))
+
+
 def normalize_bool_str(v: Optional[str]) -> Optional[bool]:
     if v is None:
         return None
-    s = str(v).strip().lower()
-    if s in ("true", "t", "1", "yes", "y"):
+    s = (v if isinstance(v, str) else str(v)).strip().lower()
+    if s in _TRUE_STRINGS:
         return True
-    if s in ("false", "f", "0", "no", "n"):
+    if s in _FALSE_STRINGS:
         return False
-    if s in ("unknown", "unset", "none", ""):
-        return None
+    # "unknown", "unset", "none", "" and anything unrecognised
     return None
 
 
 def normalize_unknown_str(v: Optional[str]) -> Optional[str]:
     if v is None:
         return None
-    s = str(v).strip()
+    s = (v if isinstance(v, str) else str(v)).strip()
     if not s:
         return None
-    if s.lower() in ("unknown", "unset", "none"):
+    if s.lower() in _UNKNOWN_STRINGS:
         return None
-    return s
\ No newline at end of file
+    return s
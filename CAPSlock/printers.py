@@ -1,12 +1,8 @@
 from __future__ import annotations
+import sys
 from typing import List, Set, Tuple, Any, Dict
 from CAPSlock.models import PolicyResult
-
-
-def _has_signal_dependent_note(reason: str | None) -> bool:
-    if not reason:
-        return False
-    return "Signal-dependent:" in reason
+from CAPSlock.serializers import partition_get_policies_results
 
 
 def _cond_blocks(cond: dict, key: str) -> tuple[list, list]:
@@ -23,43 +19,58 @@ def _flatten_list(blocks: list, field: str) -> list:
         elif isinstance(v, str):
             vals.append(v)
 
-    out, seen = [], set()
-    for x in vals:
-        if x not in seen:
-            out.append(x)
-            seen.add(x)
-    return out
+    # Ordered de-duplication
+    return list(dict.fromkeys(vals))
 
 
 def _format_inc_exc(title: str, inc: list, exc: list, max_items: int = 6) -> list[str]:
-    lines = []
     if not inc and not exc:
-        return lines
-
-    def fmt(vals):
-        if not vals:
-            return "(none)"
-        s = ", ".join(vals[:max_items])
-        if len(vals) > max_items:
-            s += ", ..."
-        return s
-
-    lines.append(f"  {title}:")
-    lines.append(f"    Include: {fmt(inc)}")
+        return []
+
+    inc_text = ", ".join(inc[:max_items]) + (", ..." if len(inc) > max_items else "") if inc else "(none)"
+    lines = [f"  {title}:", f"    Include: {inc_text}"]
     if exc:
-        lines.append(f"    Exclude: {fmt(exc)}")
+        lines.append(f"    Exclude: {', '.join(exc[:max_items])}{', ...' if len(exc) > max_items else ''}")
     return lines
 
 
+# Include/exclude conditions rendered after Users, in display order: (condition key, title).
+# Each condition's blocks list its values under the same key.
+_STD_COND = (
+    ("Locations", "Locations"),
+    ("DevicePlatforms", "Device platform"),
+    ("ClientTypes", "Client app"),
+    ("SignInRisks", "Sign-in risk"),
+    ("UserRisks", "User risk"),
+    ("AuthFlows", "Auth flow"),
+)
+
+
+# Rendered summaries keyed by id(detail). The detail is stored alongside so it
+# stays alive and its id cannot be reused by another dict while cached.
+_SUMMARY_CACHE_MAX = 4096
+_summary_cache: Dict[int, Tuple[dict, str]] = {}
+
+
 def render_conditions_summary(detail: dict) -> str:
+    cached = _summary_cache.get(id(detail))
+    if cached is not None and cached[0] is detail:
+        return cached[1]
+
+    summary = _render_conditions_summary(detail)
+    if len(_summary_cache) >= _SUMMARY_CACHE_MAX:
+        _summary_cache.clear()
+    _summary_cache[id(detail)] = (detail, summary)
+    return summary
+
+
+def _render_conditions_summary(detail: dict) -> str:
     cond = detail.get("Conditions") or {}
     out = []
 
     # Apps
     a_inc_b, a_exc_b = _cond_blocks(cond, "Applications")
-    a_inc = _flatten_list(a_inc_b, "Applications")
-    a_exc = _flatten_list(a_exc_b, "Applications")
-    out += _format_inc_exc("Apps", a_inc, a_exc)
+    out += _format_inc_exc("Apps", _flatten_list(a_inc_b, "Applications"), _flatten_list(a_exc_b, "Applications"))
 
     # Users, Groups, Roles
     u = cond.get("Users") or {}
@@ -97,41 +108,10 @@ def render_conditions_summary(detail: dict) -> str:
         if exc_roles:
             out.append(f"    Exclude Roles: {', '.join(exc_roles[:6])}{', ...' if len(exc_roles) > 6 else ''}")
 
-    # Locations
-    l_inc_b, l_exc_b = _cond_blocks(cond, "Locations")
-    l_inc = _flatten_list(l_inc_b, "Locations")
-    l_exc = _flatten_list(l_exc_b, "Locations")
-    out += _format_inc_exc("Locations", l_inc, l_exc)
-
-    # Device platform
-    p_inc_b, p_exc_b = _cond_blocks(cond, "DevicePlatforms")
-    p_inc = _flatten_list(p_inc_b, "DevicePlatforms")
-    p_exc = _flatten_list(p_exc_b, "DevicePlatforms")
-    out += _format_inc_exc("Device platform", p_inc, p_exc)
-
-    # Client app
-    c_inc_b, c_exc_b = _cond_blocks(cond, "ClientTypes")
-    c_inc = _flatten_list(c_inc_b, "ClientTypes")
-    c_exc = _flatten_list(c_exc_b, "ClientTypes")
-    out += _format_inc_exc("Client app", c_inc, c_exc)
-
-    # Sign-in risk
-    s_inc_b, s_exc_b = _cond_blocks(cond, "SignInRisks")
-    s_inc = _flatten_list(s_inc_b, "SignInRisks")
-    s_exc = _flatten_list(s_exc_b, "SignInRisks")
-    out += _format_inc_exc("Sign-in risk", s_inc, s_exc)
-
-    # User risk
-    ur_inc_b, ur_exc_b = _cond_blocks(cond, "UserRisks")
-    ur_inc = _flatten_list(ur_inc_b, "UserRisks")
-    ur_exc = _flatten_list(ur_exc_b, "UserRisks")
-    out += _format_inc_exc("User risk", ur_inc, ur_exc)
-
-    # Auth flow
-    af_inc_b, af_exc_b = _cond_blocks(cond, "AuthFlows")
-    af_inc = _flatten_list(af_inc_b, "AuthFlows")
-    af_exc = _flatten_list(af_exc_b, "AuthFlows")
-    out += _format_inc_exc("Auth flow", af_inc, af_exc)
+    # Locations, device platform, client app, risks and auth flow
+    for key, title in _STD_COND:
+        inc_b, exc_b = _cond_blocks(cond, key)
+        out += _format_inc_exc(title, _flatten_list(inc_b, key), _flatten_list(exc_b, key))
 
     # Device rules
     dev = cond.get("Devices") or {}
@@ -176,17 +156,17 @@ def _fmt_set(vals: Set[str]) -> str:
     items = sorted(vals)
     return ", ".join(items)
 
-def print_full(r: PolicyResult, show_raw: bool = False):
-    print(f"- {r.policy.displayName} ({r.policy.objectId})")
+def _full_lines(r: PolicyResult, out: List[str], show_raw: bool = False) -> None:
+    out.append(f"- {r.policy.displayName} ({r.policy.objectId})")
     if r.state:
-        print(f"  State:   {r.state}")
+        out.append(f"  State:   {r.state}")
     if r.effect:
-        print(f"  Effect:  {r.effect}")
+        out.append(f"  Effect:  {r.effect}")
     if r.controls is not None:
-        print(f"  Controls:{r.controls}")
-    print(f"  Reason:  {r.applies_reason}")
+        out.append(f"  Controls:{r.controls}")
+    out.append(f"  Reason:  {r.applies_reason}")
 
-    print(render_conditions_summary(r.detail))
+    out.append(render_conditions_summary(r.detail))
 
     if show_raw:
         cond = r.detail.get("Conditions", {}) or {}
@@ -194,68 +174,81 @@ def print_full(r: PolicyResult, show_raw: bool = False):
         users_cond = cond.get("Users", {}) or {}
         locs = cond.get("Locations", {}) or {}
 
-        print(f"  Apps Include:   {apps.get('Include', [])}")
-        print(f"  Users Include:  {users_cond.get('Include', [])}")
-        print(f"  Users Exclude:  {users_cond.get('Exclude', [])}")
-        print(f"  Locations:      {locs}")
+        out.append(f"  Apps Include:   {apps.get('Include', [])}")
+        out.append(f"  Users Include:  {users_cond.get('Include', [])}")
+        out.append(f"  Users Exclude:  {users_cond.get('Exclude', [])}")
+        out.append(f"  Locations:      {locs}")
+
+    out.append("")
+
 
-    print()
+def _minimal_lines(r: PolicyResult, out: List[str]) -> None:
+    out.append(f"- {r.policy.displayName} ({r.policy.objectId})")
+    out.append(f"  Reason:  {r.applies_reason}")
+    out.append("")
+
+
+def _write_lines(out: List[str]) -> None:
+    # One write per report instead of a print() per line
+    if out:
+        sys.stdout.write("\n".join(out) + "\n")
+
+
+def print_full(r: PolicyResult, show_raw: bool = False):
+    out: List[str] = []
+    _full_lines(r, out, show_raw)
+    _write_lines(out)
 
 
 def print_minimal(r: PolicyResult):
-    print(f"- {r.policy.displayName} ({r.policy.objectId})")
-    print(f"  Reason:  {r.applies_reason}")
-    print()
+    out: List[str] = []
+    _minimal_lines(r, out)
+    _write_lines(out)
 
 
 def print_sections_get_policies(results: List[PolicyResult], results_mode: str):
-    applied: List[PolicyResult] = []
-    excluded: List[PolicyResult] = []
-    not_included: List[PolicyResult] = []
+    applied, excluded, not_included = partition_get_policies_results(results)
 
-    for r in results:
-        if r.applies:
-            applied.append(r)
-        else:
-            if (r.applies_reason or "").lower().startswith("excluded:"):
-                excluded.append(r)
-            else:
-                not_included.append(r)
+    out: List[str] = []
 
     if results_mode in ("applied", "all"):
-        print("\n=== Applied ===\n")
+        out.append("\n=== Applied ===\n")
         for r in applied:
-            print_full(r)
+            _full_lines(r, out)
 
     if results_mode in ("exclusions", "all"):
-        print("\n=== Excluded ===\n")
+        out.append("\n=== Excluded ===\n")
         for r in excluded:
-            print_full(r)
+            _full_lines(r, out)
 
     if results_mode == "all":
-        print("\n=== Not included / not targeted ===\n")
+        out.append("\n=== Not included / not targeted ===\n")
         for r in not_included:
-            print_minimal(r)
+            _minimal_lines(r, out)
+
+    _write_lines(out)
 
 
 def print_sections_what_if(results: List[PolicyResult], strict: bool):
-    applied_all = [r for r in results if r.applies]
-    applied_def = [r for r in applied_all if not _has_signal_dependent_note(r.applies_reason)]
-    applied_rt = [r for r in applied_all if _has_signal_dependent_note(r.applies_reason)]
+    applied_def: List[PolicyResult] = []
+    applied_rt: List[PolicyResult] = []
+    for r in results:
+        if r.applies:
+            (applied_rt if r.signal_dependent else applied_def).append(r)
 
-    print("\n=== Applied (definitive) ===\n")
+    out: List[str] = ["\n=== Applied (definitive) ===\n"]
     if applied_def:
         for r in applied_def:
-            print_full(r)
+            _full_lines(r, out)
     else:
-        print("(none)\n")
+        out.append("(none)\n")
 
-    if strict:
-        return
+    if not strict:
+        out.append("\n=== Applied (signal-dependent) ===\n")
+        if applied_rt:
+            for r in applied_rt:
+                _full_lines(r, out)
+        else:
+            out.append("(none)\n")
 
-    print("\n=== Applied (signal-dependent) ===\n")
-    if applied_rt:
-        for r in applied_rt:
-            print_full(r)
-    else:
-        print("(none)\n")
\ No newline at end of file
+    _write_lines(out)
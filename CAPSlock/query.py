@@ -1,11 +1,12 @@
 from __future__ import annotations
-from typing import List, Optional
-from sqlalchemy import func
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import func, literal, null, select, union_all
 from roadtools.roadlib.metadef.database import User, Group, DirectoryRole, Application, ServicePrincipal
-from CAPSlock.db import load_capolicies, parse_policy_details, load_named_locations
-from CAPSlock.models import SignInContext, PolicyResult, UserContext
+from CAPSlock.db import iter_capolicies, parse_policy_details, load_named_locations
+from CAPSlock.models import SignInContext, PolicyResult, PolicyShape, UserContext, UserPolicies
 from CAPSlock.resolvers import build_name_resolver
 from CAPSlock.evaluator import evaluate_policy_detail
+from CAPSlock.conditions import build_policy_shape
 
 
 def _get_user_by_upn(session, upn: str) -> Optional[User]:
@@ -14,24 +15,25 @@ def _get_user_by_upn(session, upn: str) -> Optional[User]:
     )
 
 def _build_user_context(session, user: User) -> UserContext:
-    groups = (
-        session.query(Group)
+    # Group and role memberships in one round trip: (kind, objectId, roleTemplateId)
+    memberships = union_all(
+        select(literal("G"), Group.objectId, null())
         .join(Group.memberUsers)
-        .filter(User.objectId == user.objectId)
-        .all()
-    )
-    group_ids = {g.objectId for g in groups}
-
-    roles = (
-        session.query(DirectoryRole)
+        .where(User.objectId == user.objectId),
+        select(literal("R"), DirectoryRole.objectId, DirectoryRole.roleTemplateId)
         .join(DirectoryRole.memberUsers)
-        .filter(User.objectId == user.objectId)
-        .all()
+        .where(User.objectId == user.objectId),
     )
 
-    role_object_ids = {r.objectId for r in roles}
-
-    role_template_ids = {getattr(r, "roleTemplateId", None) for r in roles}
+    group_ids = set()
+    role_object_ids = set()
+    role_template_ids = set()
+    for kind, object_id, template_id in session.execute(memberships):
+        if kind == "G":
+            group_ids.add(object_id)
+        else:
+            role_object_ids.add(object_id)
+            role_template_ids.add(template_id)
     role_template_ids.discard(None)
 
     return UserContext(
@@ -43,72 +45,119 @@ def _build_user_context(session, user: User) -> UserContext:
     )
 
 
-def get_policy_results_for_user(
-    session,
-    user_upn: str,
-    signin_ctx: Optional[SignInContext] = None,
-    mode: str = "get-policies",
-) -> List[PolicyResult]:
-    if signin_ctx is None:
-        signin_ctx = SignInContext()
+def _try_policy_shape(policy: Any, detail: Dict[str, Any]) -> Optional[PolicyShape]:
+    # A detail whose conditions the shape builder cannot read is still listed;
+    # the evaluators fall back to building the shape when they need it
+    try:
+        return build_policy_shape(detail)
+    except (AttributeError, TypeError, KeyError, ValueError) as e:
+        print(f"[!] Failed to read conditions for {policy.displayName}: {e}")
+        return None
+
+
+def _load_policies(session) -> Tuple[List[Tuple[Any, Dict[str, Any], Optional[PolicyShape]]], Dict[str, bool]]:
+    # Parsed policies and named locations; they do not depend on the user
+    details = [(p, d, _try_policy_shape(p, d)) for p in iter_capolicies(session) for d in parse_policy_details(p)]
+    return details, load_named_locations(session)
 
+
+def load_user_policies(session, user_upn: str) -> Optional[UserPolicies]:
     user: Optional[User] = _get_user_by_upn(session, user_upn)
     if not user:
         print(f"[!] User {user_upn} not found in DB")
-        return []
+        return None
 
-    resolver = build_name_resolver(session)
+    details, location_trust_map = _load_policies(session)
 
-    uctx = _build_user_context(session, user)
-    policies = load_capolicies(session)
+    return UserPolicies(
+        user_ctx=_build_user_context(session, user),
+        details=details,
+        location_trust_map=location_trust_map,
+        resolver=build_name_resolver(session),
+    )
 
-    location_trust_map = load_named_locations(session)
 
-    results: List[PolicyResult] = []
-    for p in policies:
-        for d in parse_policy_details(p):
-            results.append(
-                evaluate_policy_detail(
-                    policy=p,
-                    detail=d,
-                    user_ctx=uctx,
-                    signin_ctx=signin_ctx,
-                    mode=mode,
-                    resolver=resolver,
-                    location_trust_map=location_trust_map,
-                )
-            )
+def evaluate_policies(
+    loaded: UserPolicies,
+    signin_ctx: Optional[SignInContext] = None,
+    mode: str = "get-policies",
+) -> List[PolicyResult]:
+    if signin_ctx is None:
+        signin_ctx = SignInContext()
 
-    return results
+    return [
+        evaluate_policy_detail(
+            policy=p,
+            detail=d,
+            user_ctx=loaded.user_ctx,
+            signin_ctx=signin_ctx,
+            mode=mode,
+            resolver=loaded.resolver,
+            location_trust_map=loaded.location_trust_map,
+            shape=shape,
+        )
+        for p, d, shape in loaded.details
+    ]
 
-def convert_from_id(session, object_id: str) -> List[str]:
-    out: List[str] = []
-    oid = object_id.strip()
 
-    u = session.query(User).filter(User.objectId == oid).one_or_none()
-    if u:
-        label = u.userPrincipalName or u.displayName or "(no upn)"
-        out.append(f"[User]: {label} - {u.objectId}")
+def get_policy_results_for_user(
+    session,
+    user_upn: str,
+    signin_ctx: Optional[SignInContext] = None,
+    mode: str = "get-policies",
+) -> List[PolicyResult]:
+    loaded = load_user_policies(session, user_upn)
+    if loaded is None:
+        return []
 
-    g = session.query(Group).filter(Group.objectId == oid).one_or_none()
-    if g:
-        label = g.displayName or "(no name)"
-        out.append(f"[Group]: {label} - {g.objectId}")
+    return evaluate_policies(loaded, signin_ctx=signin_ctx, mode=mode)
+
+# Lookup kinds in output order, with their display prefix and empty-label fallback
+_KIND_USER, _KIND_GROUP, _KIND_ROLE, _KIND_APP, _KIND_SP = range(5)
+_KIND_LABELS = (
+    ("User", "(no upn)"),
+    ("Group", "(no name)"),
+    ("Role", "(no name)"),
+    ("Application", "(no name)"),
+    ("ServicePrincipal", "(no name)"),
+)
+
+
+def _kind_leg(kind: int, model, match, secondary=None, limit: Optional[int] = None):
+    # Every leg projects (kind, objectId, label, secondary label) so they can be UNION ALLed
+    stmt = select(
+        literal(kind).label("kind"),
+        model.objectId.label("object_id"),
+        (model.userPrincipalName if model is User else model.displayName).label("label"),
+        (secondary if secondary is not None else null()).label("label2"),
+    ).where(match)
+    if limit is not None:
+        # SQLite rejects LIMIT on a bare compound member, so wrap the leg
+        stmt = select(stmt.limit(limit).subquery())
+    return stmt
+
+
+def _format_lookup(session, legs) -> List[str]:
+    rows = session.execute(union_all(*legs)).all()
+    # Stable sort keeps the per-table row order while grouping by kind
+    rows.sort(key=lambda r: r[0])
+    out: List[str] = []
+    for kind, object_id, label, label2 in rows:
+        name, fallback = _KIND_LABELS[kind]
+        out.append(f"[{name}]: {label or label2 or fallback} - {object_id}")
+    return out
 
-    r = session.query(DirectoryRole).filter(DirectoryRole.roleTemplateId == oid).one_or_none()
-    if r:
-        label = r.displayName or "(no name)"
-        out.append(f"[Role]: {label} - {r.objectId}")
 
-    a = session.query(Application).filter(Application.objectId == oid).one_or_none()
-    if a:
-        label = a.displayName or "(no name)"
-        out.append(f"[Application]: {label} - {a.objectId}")
+def convert_from_id(session, object_id: str) -> List[str]:
+    oid = object_id.strip()
 
-    sp = session.query(ServicePrincipal).filter(ServicePrincipal.appId == oid).one_or_none()
-    if sp:
-        label = sp.displayName or "(no name)"
-        out.append(f"[ServicePrincipal]: {label} - {sp.objectId}")
+    out = _format_lookup(session, (
+        _kind_leg(_KIND_USER, User, User.objectId == oid, secondary=User.displayName),
+        _kind_leg(_KIND_GROUP, Group, Group.objectId == oid),
+        _kind_leg(_KIND_ROLE, DirectoryRole, DirectoryRole.roleTemplateId == oid),
+        _kind_leg(_KIND_APP, Application, Application.objectId == oid),
+        _kind_leg(_KIND_SP, ServicePrincipal, ServicePrincipal.appId == oid),
+    ))
 
     if not out:
         out.append(f"[Unknown]: {oid}")
@@ -116,39 +165,22 @@ def convert_from_id(session, object_id: str) -> List[str]:
     return out
 
 def convert_from_name(session, name: str, limit: int = 10) -> List[str]:
-    out: List[str] = []
     q = name.strip()
     if not q:
         return ["[Unknown]: (empty)"]
 
-    users = session.query(User).filter(
-        (User.userPrincipalName == q) | (User.displayName == q)
-    ).limit(limit).all()
-    for u in users:
-        label = u.userPrincipalName or u.displayName or "(no upn)"
-        out.append(f"[User]: {label} - {u.objectId}")
-
-    groups = session.query(Group).filter(Group.displayName == q).limit(limit).all()
-    for g in groups:
-        label = g.displayName or "(no name)"
-        out.append(f"[Group]: {label} - {g.objectId}")
-
-    roles = session.query(DirectoryRole).filter(DirectoryRole.displayName == q).limit(limit).all()
-    for r in roles:
-        label = r.displayName or "(no name)"
-        out.append(f"[Role]: {label} - {r.objectId}")
-
-    apps = session.query(Application).filter(Application.displayName == q).limit(limit).all()
-    for a in apps:
-        label = a.displayName or "(no name)"
-        out.append(f"[Application]: {label} - {a.objectId}")
-
-    sps = session.query(ServicePrincipal).filter(ServicePrincipal.displayName == q).limit(limit).all()
-    for sp in sps:
-        label = sp.displayName or "(no name)"
-        out.append(f"[ServicePrincipal]: {label} - {sp.objectId}")
+    out = _format_lookup(session, (
+        _kind_leg(
+            _KIND_USER, User, (User.userPrincipalName == q) | (User.displayName == q),
+            secondary=User.displayName, limit=limit,
+        ),
+        _kind_leg(_KIND_GROUP, Group, Group.displayName == q, limit=limit),
+        _kind_leg(_KIND_ROLE, DirectoryRole, DirectoryRole.displayName == q, limit=limit),
+        _kind_leg(_KIND_APP, Application, Application.displayName == q, limit=limit),
+        _kind_leg(_KIND_SP, ServicePrincipal, ServicePrincipal.displayName == q, limit=limit),
+    ))
 
     if not out:
         out.append(f"[Unknown]: {q}")
 
-    return out
\ No newline at end of file
+    return out
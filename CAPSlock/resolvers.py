@@ -16,7 +16,7 @@ def build_user_context(session, user: User) -> UserContext:
         .filter(User.objectId == user.objectId)
         .all()
     )
-    group_ids = {g.objectId for g in groups if getattr(g, "objectId", None)}
+    group_ids = {g.objectId for g in groups if g.objectId}
 
     roles = (
         session.query(DirectoryRole)
@@ -25,13 +25,8 @@ def build_user_context(session, user: User) -> UserContext:
         .all()
     )
 
-    role_object_ids = {r.objectId for r in roles if getattr(r, "objectId", None)}
-
-    role_template_ids = set()
-    for r in roles:
-        tid = getattr(r, "roleTemplateId", None)
-        if tid:
-            role_template_ids.add(tid)
+    role_object_ids = {r.objectId for r in roles if r.objectId}
+    role_template_ids = {r.roleTemplateId for r in roles if r.roleTemplateId}
 
     return UserContext(
         user=user,
@@ -61,7 +56,11 @@ def build_name_resolver(session) -> NameResolver:
     )
 
 
-def friendly_ids(resolver: Optional[NameResolver], ids: list[str], kind: str) -> list[str]:
+def friendly_ids(resolver: Optional[NameResolver], ids: list[str], kind: str, limit: Optional[int] = None) -> list[str]:
+    # limit resolves only the first ids, for callers that display a truncated list
+    if limit is not None:
+        ids = ids[:limit]
+
     if resolver is None:
         return ids
 
@@ -1,20 +1,57 @@
 from __future__ import annotations
-from typing import Any, Dict, List
+from operator import attrgetter
+from typing import Any, Dict, List, Tuple
 from CAPSlock.models import PolicyResult
 
 
+# Serialized keys, in output order, and the PolicyResult attributes they come from
+_KEYS = (
+    "policy_id",
+    "policy_name",
+    "applies",
+    "effect",
+    "controls",
+    "state",
+    "applies_reason",
+    "detail",
+)
+_GETTER = attrgetter(
+    "policy.objectId",
+    "policy.displayName",
+    "applies",
+    "effect",
+    "controls",
+    "state",
+    "applies_reason",
+    "detail",
+)
+
+
+def partition_get_policies_results(
+    results: List[PolicyResult],
+) -> Tuple[List[PolicyResult], List[PolicyResult], List[PolicyResult]]:
+    """Split get-policies results into (applied, excluded, not_included) in one pass."""
+    applied: List[PolicyResult] = []
+    excluded: List[PolicyResult] = []
+    not_included: List[PolicyResult] = []
+
+    for r in results:
+        if r.applies:
+            applied.append(r)
+        # Targeting always emits the canonical "Excluded:" prefix
+        elif (r.applies_reason or "").startswith("Excluded:"):
+            excluded.append(r)
+        else:
+            not_included.append(r)
+
+    return applied, excluded, not_included
+
+
 def serialize_policy_result(result: PolicyResult) -> Dict[str, Any]:
     """Convert a PolicyResult to a JSON-serializable dictionary."""
-    return {
-        "policy_id": result.policy.objectId,
-        "policy_name": result.policy.displayName,
-        "applies": result.applies,
-        "effect": result.effect,
-        "controls": result.controls or [],
-        "state": result.state,
-        "applies_reason": result.applies_reason,
-        "detail": result.detail,
-    }
+    d = dict(zip(_KEYS, _GETTER(result)))
+    d["controls"] = d["controls"] or []
+    return d
 
 
 def serialize_policy_results(results: List[PolicyResult]) -> List[Dict[str, Any]]:
@@ -24,20 +61,10 @@ def serialize_policy_results(results: List[PolicyResult]) -> List[Dict[str, Any]
 
 def categorize_get_policies_results(results: List[PolicyResult]) -> Dict[str, Any]:
     """Categorize get-policies results into applied, excluded, and not_included."""
-    applied = []
-    excluded = []
-    not_included = []
-
-    for r in results:
-        serialized = serialize_policy_result(r)
-        if r.applies:
-            applied.append(serialized)
-        else:
-            reason = (r.applies_reason or "").lower()
-            if reason.startswith("excluded:"):
-                excluded.append(serialized)
-            else:
-                not_included.append(serialized)
+    applied, excluded, not_included = (
+        [serialize_policy_result(r) for r in bucket]
+        for bucket in partition_get_policies_results(results)
+    )
 
     return {
         "applied": applied,
@@ -52,24 +79,20 @@ def categorize_get_policies_results(results: List[PolicyResult]) -> Dict[str, An
 
 def categorize_what_if_results(results: List[PolicyResult]) -> Dict[str, Any]:
     """Categorize what-if results into definitive and signal-dependent."""
-    applied_all = [r for r in results if r.applies]
-
     applied_definitive = []
     applied_signal_dependent = []
 
-    for r in applied_all:
-        serialized = serialize_policy_result(r)
-        reason = r.applies_reason or ""
-        if "Signal-dependent:" in reason:
-            applied_signal_dependent.append(serialized)
-        else:
-            applied_definitive.append(serialized)
+    for r in results:
+        if r.applies:
+            (applied_signal_dependent if r.signal_dependent else applied_definitive).append(
+                serialize_policy_result(r)
+            )
 
     return {
         "applied_definitive": applied_definitive,
         "applied_signal_dependent": applied_signal_dependent,
         "total_policies": len(results),
-        "applied_count": len(applied_all),
+        "applied_count": len(applied_definitive) + len(applied_signal_dependent),
         "definitive_count": len(applied_definitive),
         "signal_dependent_count": len(applied_signal_dependent),
     }
@@ -1,71 +1,98 @@
 from __future__ import annotations
-from typing import Any, Dict, Optional, Set
+from typing import Any, Dict, List, Optional, Tuple
 from CAPSlock.models import UserContext, TargetingResult, NameResolver
 from CAPSlock.resolvers import friendly_ids
 
 
+_ALL = frozenset(("All",))
+_EMPTY: Tuple[str, ...] = ()
+
+
+def _fixed_result(status: str, applies_reason: str, include_via: str = "") -> TargetingResult:
+    # Shared results whose outcome does not depend on the user; match sequences
+    # are empty tuples, so callers must treat them as read-only
+    return TargetingResult(
+        status=status,
+        applies_reason=applies_reason,
+        include_via=include_via,
+        matched_include_users=_EMPTY,
+        matched_include_groups=_EMPTY,
+        matched_include_roles=_EMPTY,
+        matched_exclude_users=_EMPTY,
+        matched_exclude_groups=_EMPTY,
+        matched_exclude_roles=_EMPTY,
+    )
+
+
+_NO_INCLUDE_BLOCKS_RESULT = _fixed_result("included", "Included: no include blocks found (treat as All users)", "All users")
+_ALL_USERS_RESULT = _fixed_result("included", "Included: All users", "All users")
+_NOT_MATCHED_RESULT = _fixed_result("not_targeted", "Not included: user/group/role did not match any include rules")
+_NO_RULES_RESULT = _fixed_result("not_targeted", "Not included: no include rules understood")
+
+
 def evaluate_user_targeting(detail: Dict[str, Any], user_ctx: UserContext, resolver: Optional[NameResolver] = None) -> TargetingResult:
     cond_users = (detail.get("Conditions", {}) or {}).get("Users", {}) or {}
     include_blocks = cond_users.get("Include") or []
     exclude_blocks = cond_users.get("Exclude") or []
 
-    inc_users: Set[str] = set()
-    inc_groups: Set[str] = set()
-    inc_roles: Set[str] = set()
-
-    exc_users: Set[str] = set()
-    exc_groups: Set[str] = set()
-    exc_roles: Set[str] = set()
+    # No user scoping at all: nothing to exclude and everyone is included
+    if not include_blocks and not exclude_blocks:
+        return _NO_INCLUDE_BLOCKS_RESULT
 
-    include_all_users = False
+    users_all: List[str] = []
+    groups_all: List[str] = []
+    roles_all: List[str] = []
 
     for blk in include_blocks:
-        users = blk.get("Users") or []
-        groups = blk.get("Groups") or []
-        roles = (
+        users_all.extend(blk.get("Users") or [])
+        groups_all.extend(blk.get("Groups") or [])
+        roles_all.extend(
             blk.get("DirectoryRoles")
             or blk.get("Roles")
             or blk.get("RoleTemplateIds")
             or []
         )
 
-        if "All" in users or "All" in groups or "All" in roles:
-            include_all_users = True
+    include_all_users = (
+        not include_blocks
+        or "All" in users_all
+        or "All" in groups_all
+        or "All" in roles_all
+    )
 
-        inc_users.update(u for u in users if u != "All")
-        inc_groups.update(g for g in groups if g != "All")
-        inc_roles.update(r for r in roles if r != "All")
+    inc_users = frozenset(users_all) - _ALL
+    inc_groups = frozenset(groups_all) - _ALL
+    inc_roles = frozenset(roles_all) - _ALL
 
-    if not include_blocks:
-        include_all_users = True
+    users_all, groups_all, roles_all = [], [], []
 
     for blk in exclude_blocks:
-        users = blk.get("Users") or []
-        groups = blk.get("Groups") or []
-        roles = (
+        users_all.extend(blk.get("Users") or [])
+        groups_all.extend(blk.get("Groups") or [])
+        roles_all.extend(
             blk.get("DirectoryRoles")
             or blk.get("Roles")
             or blk.get("RoleTemplateIds")
             or []
         )
 
-        exc_users.update(users)
-        exc_groups.update(groups)
-        exc_roles.update(roles)
+    exc_users = frozenset(users_all)
+    exc_groups = frozenset(groups_all)
+    exc_roles = frozenset(roles_all)
 
     matched_exc_users = [user_ctx.object_id] if user_ctx.object_id in exc_users else []
-    matched_exc_groups = list(user_ctx.groups & exc_groups)
-    matched_exc_roles = list((user_ctx.role_object_ids & exc_roles) | (user_ctx.role_template_ids & exc_roles))
+    matched_exc_groups = list(user_ctx.effective_groups & exc_groups)
+    matched_exc_roles = list(user_ctx.effective_roles & exc_roles)
 
     if matched_exc_users or matched_exc_groups or matched_exc_roles:
         if matched_exc_users:
             reason = "Excluded: user explicitly excluded"
         elif matched_exc_groups:
-            friendly = friendly_ids(resolver, matched_exc_groups, "group")
-            reason = f"Excluded: user in excluded group(s): {friendly[:3]}{'...' if len(friendly) > 3 else ''}"
+            friendly = friendly_ids(resolver, matched_exc_groups, "group", limit=3)
+            reason = f"Excluded: user in excluded group(s): {friendly}{'...' if len(matched_exc_groups) > 3 else ''}"
         else:
-            friendly = friendly_ids(resolver, matched_exc_roles, "role")
-            reason = f"Excluded: user has excluded role(s): {friendly[:3]}{'...' if len(friendly) > 3 else ''}"
+            friendly = friendly_ids(resolver, matched_exc_roles, "role", limit=3)
+            reason = f"Excluded: user has excluded role(s): {friendly}{'...' if len(matched_exc_roles) > 3 else ''}"
 
         return TargetingResult(
             status="excluded",
@@ -73,39 +100,19 @@ def evaluate_user_targeting(detail: Dict[str, Any], user_ctx: UserContext, resol
             matched_exclude_users=matched_exc_users,
             matched_exclude_groups=matched_exc_groups,
             matched_exclude_roles=matched_exc_roles,
-            matched_include_users=[],
-            matched_include_groups=[],
-            matched_include_roles=[],
+            matched_include_users=_EMPTY,
+            matched_include_groups=_EMPTY,
+            matched_include_roles=_EMPTY,
         )
 
-    matched_inc_users = [user_ctx.object_id] if user_ctx.object_id in inc_users else []
-    matched_inc_groups = list(user_ctx.groups & inc_groups)
-    matched_inc_roles = list((user_ctx.role_object_ids & inc_roles) | (user_ctx.role_template_ids & inc_roles))
-
     if include_all_users:
         if not include_blocks:
-            return TargetingResult(
-                status="included",
-                applies_reason="Included: no include blocks found (treat as All users)",
-                include_via="All users",
-                matched_include_users=[],
-                matched_include_groups=[],
-                matched_include_roles=[],
-                matched_exclude_users=[],
-                matched_exclude_groups=[],
-                matched_exclude_roles=[],
-            )
-        return TargetingResult(
-            status="included",
-            applies_reason="Included: All users",
-            include_via="All users",
-            matched_include_users=[],
-            matched_include_groups=[],
-            matched_include_roles=[],
-            matched_exclude_users=[],
-            matched_exclude_groups=[],
-            matched_exclude_roles=[],
-        )
+            return _NO_INCLUDE_BLOCKS_RESULT
+        return _ALL_USERS_RESULT
+
+    matched_inc_users = [user_ctx.object_id] if user_ctx.object_id in inc_users else []
+    matched_inc_groups = list(user_ctx.effective_groups & inc_groups)
+    matched_inc_roles = list(user_ctx.effective_roles & inc_roles)
 
     if inc_users or inc_groups or inc_roles:
         if matched_inc_users:
@@ -114,57 +121,39 @@ def evaluate_user_targeting(detail: Dict[str, Any], user_ctx: UserContext, resol
                 applies_reason="Included: user explicitly targeted",
                 include_via="User",
                 matched_include_users=matched_inc_users,
-                matched_include_groups=[],
-                matched_include_roles=[],
-                matched_exclude_users=[],
-                matched_exclude_groups=[],
-                matched_exclude_roles=[],
+                matched_include_groups=_EMPTY,
+                matched_include_roles=_EMPTY,
+                matched_exclude_users=_EMPTY,
+                matched_exclude_groups=_EMPTY,
+                matched_exclude_roles=_EMPTY,
             )
         if matched_inc_groups:
-            friendly = friendly_ids(resolver, matched_inc_groups, "group")
+            friendly = friendly_ids(resolver, matched_inc_groups, "group", limit=3)
             return TargetingResult(
                 status="included",
-                applies_reason=f"Included: user in targeted group(s): {friendly[:3]}{'...' if len(friendly) > 3 else ''}",
+                applies_reason=f"Included: user in targeted group(s): {friendly}{'...' if len(matched_inc_groups) > 3 else ''}",
                 include_via="Group",
-                matched_include_users=[],
+                matched_include_users=_EMPTY,
                 matched_include_groups=matched_inc_groups,
-                matched_include_roles=[],
-                matched_exclude_users=[],
-                matched_exclude_groups=[],
-                matched_exclude_roles=[],
+                matched_include_roles=_EMPTY,
+                matched_exclude_users=_EMPTY,
+                matched_exclude_groups=_EMPTY,
+                matched_exclude_roles=_EMPTY,
             )
         if matched_inc_roles:
-            friendly = friendly_ids(resolver, matched_inc_roles, "role")
+            friendly = friendly_ids(resolver, matched_inc_roles, "role", limit=3)
             return TargetingResult(
                 status="included",
-                applies_reason=f"Included: user has targeted role(s): {friendly[:3]}{'...' if len(friendly) > 3 else ''}",
+                applies_reason=f"Included: user has targeted role(s): {friendly}{'...' if len(matched_inc_roles) > 3 else ''}",
                 include_via="Role",
-                matched_include_users=[],
-                matched_include_groups=[],
+                matched_include_users=_EMPTY,
+                matched_include_groups=_EMPTY,
                 matched_include_roles=matched_inc_roles,
-                matched_exclude_users=[],
-                matched_exclude_groups=[],
-                matched_exclude_roles=[],
+                matched_exclude_users=_EMPTY,
+                matched_exclude_groups=_EMPTY,
+                matched_exclude_roles=_EMPTY,
             )
 
-        return TargetingResult(
-            status="not_targeted",
-            applies_reason="Not included: user/group/role did not match any include rules",
-            matched_include_users=[],
-            matched_include_groups=[],
-            matched_include_roles=[],
-            matched_exclude_users=[],
-            matched_exclude_groups=[],
-            matched_exclude_roles=[],
-        )
+        return _NOT_MATCHED_RESULT
 
-    return TargetingResult(
-        status="not_targeted",
-        applies_reason="Not included: no include rules understood",
-        matched_include_users=[],
-        matched_include_groups=[],
-        matched_include_roles=[],
-        matched_exclude_users=[],
-        matched_exclude_groups=[],
-        matched_exclude_roles=[],
-    )
\ No newline at end of file
+    return _NO_RULES_RESULT
\ No newline at end of file
@@ -1,29 +1,87 @@
 from __future__ import annotations
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.staticfiles import StaticFiles
+from fastapi.utils import is_body_allowed_for_status_code
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any, List
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, ConfigDict, Field
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from typing import Optional, Dict, Any, List, Tuple
+from dataclasses import dataclass, fields, is_dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+import hashlib
+import json
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+import os
+from functools import lru_cache
+from threading import Lock
+import time
+from sqlalchemy.orm import sessionmaker
 import uvicorn
 
-from CAPSlock.db import get_session, DB_PATH
-from CAPSlock.models import SignInContext
-from CAPSlock.query import get_policy_results_for_user
-from CAPSlock.analyze import analyze
+from CAPSlock.db import get_engine, DB_PATH
+from CAPSlock.models import PolicyResult, SignInContext, UserPolicies
+from CAPSlock.query import evaluate_policies, load_user_policies
+from CAPSlock.analyze import analyze_db
 from CAPSlock.serializers import (
     categorize_get_policies_results,
     categorize_what_if_results,
+    partition_get_policies_results,
     serialize_policy_results,
 )
 from CAPSlock.normalize import normalize_bool_str, normalize_unknown_str
 
 
+def _default(obj: Any) -> Any:
+    # Values the JSON encoders cannot handle natively: DB row values, plus response
+    # dataclasses on the stdlib fallback (orjson serializes dataclasses itself)
+    if is_dataclass(obj):
+        return {f.name: getattr(obj, f.name) for f in fields(obj)}
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (UUID, Decimal)):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+try:
+    import orjson
+
+    def _dumps(content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    def _dumps(content: Any) -> bytes:
+        return json.dumps(
+            content,
+            default=_default,
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+
+class APIResponse(JSONResponse):
+    # Handlers return this directly, skipping jsonable_encoder; rendered with
+    # orjson when it is installed
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return _dumps(content)
+
+
 app = FastAPI(
     title="CAPSlock API",
     description="Conditional Access Policy Analysis API",
     version="1.0.0",
+    default_response_class=APIResponse,
 )
 
 
@@ -35,9 +93,72 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# all-policies and analyze return large JSON documents that compress well
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+
+# Error bodies go through the same encoder as successful responses
+@app.exception_handler(StarletteHTTPException)
+async def _http_exception_handler(request: Request, exc: StarletteHTTPException):
+    headers = getattr(exc, "headers", None)
+    if not is_body_allowed_for_status_code(exc.status_code):
+        return Response(status_code=exc.status_code, headers=headers)
+    return APIResponse({"detail": exc.detail}, status_code=exc.status_code, headers=headers)
+
+
+@app.exception_handler(Exception)
+async def _unhandled_exception_handler(request: Request, exc: Exception):
+    return APIResponse({"detail": str(exc)}, status_code=500)
+
+
+
+@dataclass(slots=True)
+class PolicyOut:
+    # One /api/all-policies entry; fields are serialized in declaration order
+    policy_id: str
+    policy_name: Optional[str]
+    state: str
+    created: Optional[str]
+    modified: Optional[str]
+    detail: Dict[str, Any]
+
+
+@dataclass(slots=True)
+class ScenarioOut:
+    # The what-if scenario echoed back in the response
+    resource: Optional[str]
+    acr: Optional[str]
+    trusted_location: Optional[bool]
+    platform: Optional[str]
+    client_app: Optional[str]
+    signin_risk: Optional[str]
+    user_risk: Optional[str]
+    auth_flow: Optional[str]
+    device_filter: Optional[bool]
+
+
+@dataclass(slots=True)
+class PolicyCountsOut:
+    # /api/policies "counts" for results=all
+    applied: int
+    excluded: int
+    not_included: int
+    total: int
+
+
+@dataclass(slots=True)
+class WhatIfCountsOut:
+    # /api/what-if "counts"
+    total: int
+    applied: int
+    definitive: int
+    signal_dependent: int
 
 
 class WhatIfRequest(BaseModel):
+    # Validated once by FastAPI and only read afterwards
+    model_config = ConfigDict(frozen=True)
+
     user: str = Field(..., description="User Principal Name")
     resource: Optional[str] = Field(None, description="Resource/App ID")
     acr: Optional[str] = Field(None, description="Authentication Context Class Reference")
@@ -54,6 +175,8 @@ class WhatIfRequest(BaseModel):
 
 
 class AnalyzeRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     user: str = Field(..., description="User Principal Name")
     resource: Optional[str] = Field(None, description="Resource/App ID")
     acr: Optional[str] = Field(None, description="Authentication Context Class Reference")
@@ -70,164 +193,330 @@ class AnalyzeRequest(BaseModel):
     db_path: Optional[str] = Field(DB_PATH, description="Path to roadrecon.db")
 
 
+@lru_cache(maxsize=8)
+def _session_factory(db_path: str) -> sessionmaker:
+    # One engine (and connection pool) per database instead of one per request
+    return sessionmaker(bind=get_engine(db_path), expire_on_commit=False)
+
+
+class _TTLCache:
+    # Small thread-safe TTL map; the oldest entry is evicted once maxsize is reached
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: Dict[Any, Tuple[float, Any]] = {}
+        self._lock = Lock()
+
+    def get(self, key: Any) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._data[key]
+                return None
+            return entry[1]
+
+    def set(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            if len(self._data) >= self.maxsize:
+                del self._data[next(iter(self._data))]
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+
+# Loaded policies per (db_path, DB version, user) and the all-policies listing per
+# (db_path, DB version). Policy sets change on the order of hours; the DB version
+# in the key drops entries as soon as roadrecon.db is rewritten.
+_POLICY_CACHE = _TTLCache(maxsize=1024, ttl=60)
+
+
+def _db_version(db_path: str) -> Optional[float]:
+    # The main file's mtime; writes still sitting in the WAL are covered by the TTL.
+    # The -wal file is not used because it appears, changes and disappears as
+    # readers open and close connections.
+    try:
+        return os.path.getmtime(db_path)
+    except OSError:
+        return None
+
+
+# Policy loads in flight per (db_path, user). Concurrent requests for the same user
+# wait on the first one's load instead of each re-reading the same rows.
+_INFLIGHT_LOADS: Dict[Tuple[str, str], Future] = {}
+_INFLIGHT_LOCK = Lock()
+
+
+def _load_user_policies_shared(db_path: str, user_upn: str) -> Optional[UserPolicies]:
+    cache_key = ("user", db_path, _db_version(db_path), user_upn)
+    loaded = _POLICY_CACHE.get(cache_key)
+    if loaded is not None:
+        return loaded
+
+    key = (db_path, user_upn)
+    with _INFLIGHT_LOCK:
+        pending = _INFLIGHT_LOADS.get(key)
+        if pending is None:
+            pending = _INFLIGHT_LOADS[key] = Future()
+            leader = True
+        else:
+            leader = False
+
+    if not leader:
+        return pending.result()
+
+    try:
+        with _session_factory(db_path)() as session:
+            loaded = load_user_policies(session, user_upn)
+        if loaded is not None:
+            _POLICY_CACHE.set(cache_key, loaded)
+        pending.set_result(loaded)
+        return loaded
+    except BaseException as e:
+        pending.set_exception(e)
+        raise
+    finally:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT_LOADS.pop(key, None)
+
+
+def _user_policy_results(
+    db_path: str,
+    user_upn: str,
+    signin_ctx: SignInContext,
+    mode: str,
+) -> List[PolicyResult]:
+    # get_policy_results_for_user, with the policy load shared between concurrent requests
+    loaded = _load_user_policies_shared(db_path, user_upn)
+    if loaded is None:
+        return []
+    return evaluate_policies(loaded, signin_ctx=signin_ctx, mode=mode)
+
+
+# analyze is CPU-bound pure Python; separate processes let concurrent runs use
+# more than one core. Created on first use so importing the app stays cheap.
+_ANALYZE_POOL: Optional[ProcessPoolExecutor] = None
+_WEB_WORKERS_ENV = "CAPSLOCK_WEB_WORKERS"
+_ANALYZE_POOL_LOCK = Lock()
+
+
+def _analyze_pool() -> ProcessPoolExecutor:
+    global _ANALYZE_POOL
+    with _ANALYZE_POOL_LOCK:
+        if _ANALYZE_POOL is None:
+            # Split the CPUs between the server processes started by __main__
+            server_workers = int(os.environ.get(_WEB_WORKERS_ENV) or 1)
+            # spawn, not fork: this process already runs threads and holds engine
+            # connections and locks that a forked child would inherit mid-use
+            _ANALYZE_POOL = ProcessPoolExecutor(
+                max_workers=max(1, (os.cpu_count() or 1) // server_workers),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _ANALYZE_POOL
+
+
+def _lower_or_none(value: Optional[str]) -> Optional[str]:
+    return value.lower() if value else None
+
+
+# Signals matched case-insensitively, lowercased once on the way in
+_LOWERED_SIGNALS = ("platform", "signin_risk", "user_risk", "auth_flow")
+
+
+def _scenario_signals(request: WhatIfRequest | AnalyzeRequest) -> Dict[str, Any]:
+    # The permutable sign-in signals, normalized the same way for what-if and analyze
+    signals = {name: _lower_or_none(getattr(request, name)) for name in _LOWERED_SIGNALS}
+    signals["trusted_location"] = request.trusted_location
+    signals["client_app"] = request.client_app
+    signals["device_filter"] = request.device_filter
+    return signals
+
+
+def _normalize_upn(user: str) -> str:
+    return user.strip().lower()
+
+
+_INDEX_PATH = os.path.join(os.path.dirname(__file__), "static", "index.html")
+
+
+@lru_cache(maxsize=1)
+def _index_page() -> Tuple[bytes, str]:
+    # The SPA entry page never changes while the server runs: read and hash it once
+    with open(_INDEX_PATH, "rb") as f:
+        body = f.read()
+    return body, '"' + hashlib.md5(body, usedforsecurity=False).hexdigest() + '"'
+
+
 @app.get("/")
-async def root():
-    import os
-    static_path = os.path.join(os.path.dirname(__file__), "static", "index.html")
-    return FileResponse(static_path)
+async def root(request: Request):
+    body, etag = _index_page()
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=60"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in (t.strip() for t in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="text/html", headers=headers)
 
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "service": "CAPSlock API"}
+    return APIResponse({"status": "healthy", "service": "CAPSlock API"})
 
 
+# Handlers that touch the database are plain `def` routes: FastAPI runs them in
+# its threadpool, so a slow query or analyze run never blocks the event loop.
 @app.get("/api/locations")
-async def get_locations(
+def get_locations(
     db_path: str = Query(DB_PATH, description="Path to roadrecon.db"),
 ):
 
     try:
         from CAPSlock.db import load_named_locations
         from roadtools.roadlib.metadef.database import Policy
-        import json
-
-        session = get_session(db_path)
-        location_trust_map = load_named_locations(session)
-        locations = session.query(Policy).filter(Policy.policyType == 6).all()
-
-        result = []
-        for loc in locations:
-            is_trusted = location_trust_map.get(loc.objectId, False)
-
-
-            ip_ranges = []
-            countries = []
-            if loc.policyDetail:
-                for detail_raw in loc.policyDetail:
-                    try:
-                        detail = json.loads(detail_raw)
-                        if detail.get("IpRanges"):
-                            ip_ranges = detail["IpRanges"]
-                        if detail.get("CountriesAndRegions"):
-                            countries = detail["CountriesAndRegions"]
-                    except:
-                        pass
-
-            location_type = "Unknown"
-            if ip_ranges:
-                location_type = f"IP-based ({len(ip_ranges)} range{'s' if len(ip_ranges) != 1 else ''})"
-            elif countries:
-                location_type = f"Country-based ({len(countries)} countr{'ies' if len(countries) != 1 else 'y'})"
-
-            result.append({
-                "name": loc.displayName,
-                "id": loc.objectId,
-                "is_trusted": is_trusted,
-                "type": location_type,
-            })
-
-        session.close()
-        return {"locations": sorted(result, key=lambda x: x["name"].lower())}
+
+        with _session_factory(db_path)() as session:
+            location_trust_map = load_named_locations(session)
+            locations = session.query(Policy).filter(Policy.policyType == 6).all()
+
+            result = []
+            for loc in locations:
+                is_trusted = location_trust_map.get(loc.objectId, False)
+
+
+                ip_ranges = []
+                countries = []
+                if loc.policyDetail:
+                    for detail_raw in loc.policyDetail:
+                        try:
+                            detail = json.loads(detail_raw)
+                            if detail.get("IpRanges"):
+                                ip_ranges = detail["IpRanges"]
+                            if detail.get("CountriesAndRegions"):
+                                countries = detail["CountriesAndRegions"]
+                        except:
+                            pass
+
+                location_type = "Unknown"
+                if ip_ranges:
+                    location_type = f"IP-based ({len(ip_ranges)} range{'s' if len(ip_ranges) != 1 else ''})"
+                elif countries:
+                    location_type = f"Country-based ({len(countries)} countr{'ies' if len(countries) != 1 else 'y'})"
+
+                result.append({
+                    "name": loc.displayName,
+                    "id": loc.objectId,
+                    "is_trusted": is_trusted,
+                    "type": location_type,
+                })
+
+        return APIResponse({"locations": sorted(result, key=lambda x: x["name"].lower())})
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _encode_all_policies(db_path: str) -> bytes:
+    from CAPSlock.db import iter_capolicies, parse_policy_details
+
+    # Each entry is encoded as it is read, so the parsed details are not all held
+    # at once; the finished body is what gets cached
+    buf = bytearray(b'{"policies":[')
+    total = 0
+    with _session_factory(db_path)() as session:
+        for policy in iter_capolicies(session):
+            for detail in parse_policy_details(policy):
+                if total:
+                    buf += b","
+                buf += _dumps(PolicyOut(
+                    policy_id=policy.objectId,
+                    policy_name=policy.displayName,
+                    state=detail.get("State", "Unknown"),
+                    created=detail.get("CreatedDateTime"),
+                    modified=detail.get("ModifiedDateTime"),
+                    detail=detail,
+                ))
+                total += 1
+    buf += b'],"total":%d}' % total
+    return bytes(buf)
+
+
 @app.get("/api/all-policies")
-async def get_all_policies(
+def get_all_policies(
     db_path: str = Query(DB_PATH, description="Path to roadrecon.db"),
 ):
 
-    try:
-        from CAPSlock.db import load_capolicies, parse_policy_details
+    cache_key = ("all", db_path, _db_version(db_path))
+    body = _POLICY_CACHE.get(cache_key)
+    if body is None:
+        try:
+            body = _encode_all_policies(db_path)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        _POLICY_CACHE.set(cache_key, body)
 
-        session = get_session(db_path)
-        policies = load_capolicies(session)
-
-        result = []
-        for policy in policies:
-            details = parse_policy_details(policy)
-            for detail in details:
-                result.append({
-                    "policy_id": policy.objectId,
-                    "policy_name": policy.displayName,
-                    "state": detail.get("State", "Unknown"),
-                    "created": detail.get("CreatedDateTime"),
-                    "modified": detail.get("ModifiedDateTime"),
-                    "detail": detail
-                })
-
-        session.close()
-        return {
-            "total": len(result),
-            "policies": result
-        }
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return Response(body, media_type="application/json")
 
 
 @app.get("/api/policies")
-async def get_policies(
+def get_policies(
     user: str = Query(..., description="User Principal Name"),
     app: Optional[str] = Query(None, description="Application ID filter"),
     results: str = Query("applied", description="Results mode: applied, exclusions, or all"),
     db_path: str = Query(DB_PATH, description="Path to roadrecon.db"),
 ):
 
-    try:
-        session = get_session(db_path)
-        signin_ctx = SignInContext(app_id=app)
+    # get-policies contexts carry no sign-in signals, so the response depends only on
+    # the query parameters and the DB; the encoded body is cached like all-policies
+    cache_key = ("get-policies", db_path, _db_version(db_path), user, app, results)
+    body = _POLICY_CACHE.get(cache_key)
+    if body is not None:
+        return Response(body, media_type="application/json")
 
-        policy_results = get_policy_results_for_user(
-            session=session,
-            user_upn=user.strip().lower(),
-            signin_ctx=signin_ctx,
+    try:
+        policy_results = _user_policy_results(
+            db_path=db_path,
+            user_upn=_normalize_upn(user),
+            signin_ctx=SignInContext(app_id=app),
             mode="get-policies",
         )
 
-        categorized = categorize_get_policies_results(policy_results)
-
-        # Filter based on results mode
-        if results == "applied":
+        # Filter based on results mode; the single-bucket modes only serialize
+        # the bucket they return
+        if results in ("applied", "exclusions"):
+            applied, excluded, _ = partition_get_policies_results(policy_results)
+            policies = serialize_policy_results(applied if results == "applied" else excluded)
             response = {
                 "user": user,
                 "results_mode": results,
-                "policies": categorized["applied"],
-                "count": categorized["applied_count"],
-            }
-        elif results == "exclusions":
-            response = {
-                "user": user,
-                "results_mode": results,
-                "policies": categorized["excluded"],
-                "count": categorized["excluded_count"],
+                "policies": policies,
+                "count": len(policies),
             }
         else:  # all
+            categorized = categorize_get_policies_results(policy_results)
             response = {
                 "user": user,
                 "results_mode": results,
                 "applied": categorized["applied"],
                 "excluded": categorized["excluded"],
                 "not_included": categorized["not_included"],
-                "counts": {
-                    "applied": categorized["applied_count"],
-                    "excluded": categorized["excluded_count"],
-                    "not_included": categorized["not_included_count"],
-                    "total": categorized["total_policies"],
-                },
+                "counts": PolicyCountsOut(
+                    applied=categorized["applied_count"],
+                    excluded=categorized["excluded_count"],
+                    not_included=categorized["not_included_count"],
+                    total=categorized["total_policies"],
+                ),
             }
 
-        session.close()
-        return response
+        body = _dumps(response)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    _POLICY_CACHE.set(cache_key, body)
+    return Response(body, media_type="application/json")
+
 
 @app.post("/api/what-if")
-async def what_if(request: WhatIfRequest):
+def what_if(request: WhatIfRequest):
 
     try:
         # Validate resource vs acr
@@ -237,25 +526,17 @@ async def what_if(request: WhatIfRequest):
                 detail="resource and acr are mutually exclusive (choose one)",
             )
 
-        session = get_session(request.db_path)
-
         signin_ctx = SignInContext(
             app_id=normalize_unknown_str(request.resource),
             acr=normalize_unknown_str(request.acr),
-            trusted_location=request.trusted_location,
-            platform=(request.platform.lower() if request.platform else None),
-            client_app=request.client_app,
-            signin_risk=(request.signin_risk.lower() if request.signin_risk else None),
-            user_risk=(request.user_risk.lower() if request.user_risk else None),
-            auth_flow=(request.auth_flow.lower() if request.auth_flow else None),
-            device_filter=request.device_filter,
             device_hybrid_joined=request.device_hybrid_joined,
             device_compliant=request.device_compliant,
+            **_scenario_signals(request),
         )
 
-        policy_results = get_policy_results_for_user(
-            session=session,
-            user_upn=request.user.strip().lower(),
+        policy_results = _user_policy_results(
+            db_path=request.db_path,
+            user_upn=_normalize_upn(request.user),
             signin_ctx=signin_ctx,
             mode="what-if",
         )
@@ -264,29 +545,28 @@ async def what_if(request: WhatIfRequest):
 
         response = {
             "user": request.user,
-            "scenario": {
-                "resource": signin_ctx.app_id,
-                "acr": signin_ctx.acr,
-                "trusted_location": signin_ctx.trusted_location,
-                "platform": signin_ctx.platform,
-                "client_app": signin_ctx.client_app,
-                "signin_risk": signin_ctx.signin_risk,
-                "user_risk": signin_ctx.user_risk,
-                "auth_flow": signin_ctx.auth_flow,
-                "device_filter": signin_ctx.device_filter,
-            },
+            "scenario": ScenarioOut(
+                resource=signin_ctx.app_id,
+                acr=signin_ctx.acr,
+                trusted_location=signin_ctx.trusted_location,
+                platform=signin_ctx.platform,
+                client_app=signin_ctx.client_app,
+                signin_risk=signin_ctx.signin_risk,
+                user_risk=signin_ctx.user_risk,
+                auth_flow=signin_ctx.auth_flow,
+                device_filter=signin_ctx.device_filter,
+            ),
             "applied_definitive": categorized["applied_definitive"],
             "applied_signal_dependent": categorized["applied_signal_dependent"],
-            "counts": {
-                "total": categorized["total_policies"],
-                "applied": categorized["applied_count"],
-                "definitive": categorized["definitive_count"],
-                "signal_dependent": categorized["signal_dependent_count"],
-            },
+            "counts": WhatIfCountsOut(
+                total=categorized["total_policies"],
+                applied=categorized["applied_count"],
+                definitive=categorized["definitive_count"],
+                signal_dependent=categorized["signal_dependent_count"],
+            ),
         }
 
-        session.close()
-        return response
+        return APIResponse(response)
 
     except HTTPException:
         raise
@@ -295,7 +575,7 @@ async def what_if(request: WhatIfRequest):
 
 
 @app.post("/api/analyze")
-async def analyze_gaps(request: AnalyzeRequest):
+def analyze_gaps(request: AnalyzeRequest):
     
     try:
         # Validate resource vs acr
@@ -310,45 +590,30 @@ async def analyze_gaps(request: AnalyzeRequest):
                 detail="You must provide either resource or acr",
             )
 
-        session = get_session(request.db_path)
-
+        # The permuted signals stay at their None defaults; analyze fills them per scenario
         base = SignInContext(
             app_id=normalize_unknown_str(request.resource),
             acr=normalize_unknown_str(request.acr),
-            trusted_location=None,
-            platform=None,
-            client_app=None,
-            signin_risk=None,
-            user_risk=None,
-            auth_flow=None,
-            device_filter=None,
             device_hybrid_joined=request.device_hybrid_joined,
             device_compliant=request.device_compliant,
         )
 
-        fixed = {
-            "trusted_location": request.trusted_location,
-            "platform": (request.platform.lower() if request.platform else None),
-            "client_app": request.client_app,
-            "signin_risk": (request.signin_risk.lower() if request.signin_risk else None),
-            "user_risk": (request.user_risk.lower() if request.user_risk else None),
-            "auth_flow": (request.auth_flow.lower() if request.auth_flow else None),
-            "device_filter": request.device_filter,
-        }
+        fixed = _scenario_signals(request)
 
-        summary, gaps = analyze(
-            session=session,
-            user_upn=request.user,
-            base=base,
-            fixed=fixed,
-            max_scenarios=request.max_scenarios,
-        )
+        # The worker opens its own session; only plain inputs cross the process boundary
+        summary, gaps = _analyze_pool().submit(
+            analyze_db,
+            request.db_path,
+            request.user,
+            base,
+            fixed,
+            request.max_scenarios,
+        ).result()
 
-        session.close()
-        return {
+        return APIResponse({
             "summary": summary,
             "gaps": gaps,
-        }
+        })
 
     except HTTPException:
         raise
@@ -363,4 +628,18 @@ app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
+    # One server process per CPU. Worker processes re-import the app, so uvicorn
+    # needs an import string; loop/http "auto" pick uvloop and httptools when
+    # installed (uvicorn[standard]) and fall back to asyncio/h11 otherwise.
+    workers = os.cpu_count() or 1
+    os.environ[_WEB_WORKERS_ENV] = str(workers)
+    uvicorn.run(
+        "api:app",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host="0.0.0.0",
+        port=8000,
+        workers=workers,
+        loop="auto",
+        http="auto",
+        log_level="info",
+    )